@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+---
+name: cdo
+
+short_description: HttpApi plugin for Cisco Defense Orchestrator (CDO)
+
+version_added: "1.2.0"
+
+description:
+    - Keeps one authenticated HTTP session to the CDO API open in the Ansible persistent connection daemon for
+      the whole play, so that the TCP connections, TLS sessions and tenant lookups of the connection pool are
+      reused by every task instead of being set up again by each module run.
+    - The cisco.cdo modules send their API calls through this session when they run over an
+      C(ansible.netcommon.httpapi) connection with C(ansible_network_os=cisco.cdo.cdo). Retries, rate limiting,
+      caching and metrics keep working as configured on each task.
+    - The CDO host is the C(ansible_host) of the connection, e.g. C(www.defenseorchestrator.com) for the us region.
+      Requests are always made over https and the C(region) option of the tasks is ignored. Tasks that set their own
+      C(api_key) do not use the connection and open a session of their own.
+    - The connection daemon serves one request at a time, so the API calls of a task are sent one after the other
+      and the C(workers) options of the modules have no effect. Set C(api_key) on tasks that onboard or gather many
+      devices concurrently.
+options:
+    api_key:
+        description:
+            - CDO API key of the tenant.
+            - When not set the connection password (C(ansible_httpapi_pass) or C(ansible_password)) is used.
+        type: str
+        env:
+            - name: CDO_API_KEY
+        vars:
+            - name: ansible_httpapi_cdo_api_key
+    pool_maxsize:
+        description: Maximum number of connections to the CDO endpoint kept open in the connection pool.
+        type: int
+        default: 10
+        vars:
+            - name: ansible_httpapi_cdo_pool_maxsize
+
+author:
+    - Aaron Hackney (@aaronhackney)
+requirements:
+  - requests
+  - ansible.netcommon
+"""
+
+import base64
+from urllib.parse import urlsplit, urlunsplit
+from ansible.errors import AnsibleConnectionFailure
+from ansible.plugins.httpapi import HttpApiBase
+from ansible_collections.cisco.cdo.plugins.module_utils._version import __version__
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
+
+
+class HttpApi(HttpApiBase):
+    def __init__(self, connection):
+        super(HttpApi, self).__init__(connection)
+        self._password = None
+        self._session = None
+
+    def login(self, username, password):
+        # CDO API keys are bearer tokens, there is no login endpoint to exchange them at
+        self._password = password
+
+    def logout(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _http_session(self):
+        """Return the pooled session of the connection, created on the first request of the play"""
+        if self._session is None:
+            token = self.get_option("api_key") or self._password or self.connection.get_option("password")
+            if not token:
+                raise AnsibleConnectionFailure("Set api_key or the connection password to the CDO API key")
+            host = self.connection.get_option("host")
+            self._session = CDORequests.create_session(
+                token, __version__, host, {"pool_maxsize": self.get_option("pool_maxsize")}
+            )
+            self._session.verify = self.connection.get_option("validate_certs")
+        return self._session
+
+    def send_request(
+        self,
+        method: str,
+        url: str,
+        body: str = None,
+        headers: dict = None,
+        timeout=None,
+        verify=None,
+        allow_redirects: bool = True,
+    ) -> dict:
+        """Send one API call made by a module over the pooled session. The scheme and host of the url are replaced
+        with the CDO host of the connection and the tenant API key is added by the session. Bodies are passed
+        base64 encoded so that they survive the JSON-RPC round trip unchanged. timeout, verify and allow_redirects
+        are those of the module request, verify falling back to validate_certs when the module left it unset."""
+        http_session = self._http_session()
+        parts = urlsplit(url)
+        url = urlunsplit(("https", self.connection.get_option("host"), parts.path, parts.query, ""))
+        response = http_session.request(
+            method,
+            url,
+            data=base64.b64decode(body) if body else None,
+            headers=headers,
+            # A (connect, read) timeout arrives as a list from the JSON-RPC call
+            timeout=tuple(timeout) if isinstance(timeout, list) else timeout,
+            verify=http_session.verify if verify is None else verify,
+            allow_redirects=allow_redirects,
+        )
+        return {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode(),
+            "elapsed": response.elapsed.total_seconds(),
+        }
+
+    def tenant_key(self) -> str:
+        """Digest of the API key identifying the tenant in the module caches, the key itself never leaves the daemon"""
+        return self._http_session().tenant_key
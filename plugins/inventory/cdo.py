@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+---
+name: cdo
+
+short_description: Cisco Defense Orchestrator (CDO) device inventory source
+
+version_added: "1.2.0"
+
+description:
+    - Build an inventory from the devices (FTD, ASA, IOS devices) of a Cisco Defense Orchestrator (CDO) tenant.
+    - Devices are grouped by their CDO device type, their tag labels and the SDC/CDG (lar) they are managed through.
+    - Supports the Ansible inventory cache plugins so that repeated runs are served from cache.
+    - Uses a YAML configuration file that ends with C(cdo.yml) or C(cdo.yaml).
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description: Token that ensures this is a source file for the C(cisco.cdo.cdo) plugin.
+        required: true
+        choices: [cisco.cdo.cdo]
+    api_key:
+        description: CDO API key of the tenant.
+        type: str
+        required: true
+        env:
+            - name: CDO_API_KEY
+    region:
+        description: CDO regional instance where the API key was generated.
+        type: str
+        choices: [us, eu, apj]
+        default: us
+        env:
+            - name: CDO_REGION
+    device_type:
+        description: Only include devices of this type.
+        type: str
+        choices: [all, asa, ios, ftd]
+        default: all
+    filter:
+        description: Only include devices whose name, ipv4 or serial matches.
+        type: str
+    fields:
+        description: >-
+            Device fields fetched from CDO and set as host variables. Entries are field names or the presets minimal
+            and full. The fields used for grouping are always fetched.
+        type: list
+        elements: str
+        default: [full]
+    page_size:
+        description: Number of devices requested from CDO per page.
+        type: int
+        default: 50
+    workers:
+        description: Number of inventory pages fetched in parallel.
+        type: int
+        default: 4
+
+author:
+    - Aaron Hackney (@aaronhackney)
+requirements:
+  - requests
+"""
+
+EXAMPLES = r"""
+---
+# cdo.yml
+plugin: cisco.cdo.cdo
+region: us
+device_type: all
+fields: [minimal, tags, larUid, serial, softwareVersion]
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.ansible/tmp/cdo_inventory
+cache_timeout: 3600
+keyed_groups:
+  - key: softwareVersion
+    prefix: version
+"""
+
+from ansible.errors import AnsibleParserError
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORegions, CDORequests
+from ansible_collections.cisco.cdo.plugins.module_utils.common import gather_inventory
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import APIError, CredentialsFailure
+from ansible_collections.cisco.cdo.plugins.module_utils._version import __version__
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+    NAME = "cisco.cdo.cdo"
+
+    def verify_file(self, path: str) -> bool:
+        """Only handle configuration files named like cdo.yml"""
+        return super(InventoryModule, self).verify_file(path) and path.endswith(("cdo.yml", "cdo.yaml"))
+
+    def fetch_devices(self) -> list:
+        """Return the device inventory of the tenant from CDO"""
+        endpoint = CDORegions.get_endpoint(self.get_option("region"))
+        http_session = CDORequests.create_session(self.get_option("api_key"), __version__, endpoint)
+        try:
+            return gather_inventory(
+                {
+                    "device_type": self.get_option("device_type"),
+                    "filter": self.get_option("filter"),
+                    "fields": self.get_option("fields") + ["uid", "name", "ipv4", "deviceType", "tags", "larUid"],
+                    "page_size": self.get_option("page_size"),
+                    "workers": self.get_option("workers"),
+                },
+                http_session,
+                endpoint,
+            )
+        except (APIError, CredentialsFailure) as e:
+            raise AnsibleParserError(f"Unable to read the CDO inventory: {e.message}")
+
+    def add_device(self, device: dict):
+        """Add a device as a host with its CDO fields as host variables, grouped by device type, tag and lar"""
+        host = self.inventory.add_host(device.get("name"))
+        for field, value in device.items():
+            self.inventory.set_variable(host, field, value)
+        if device.get("ipv4"):
+            self.inventory.set_variable(host, "ansible_host", device.get("ipv4").rsplit(":", 1)[0])
+
+        groups = list()
+        if device.get("deviceType"):
+            groups.append(device.get("deviceType"))
+        for key, values in (device.get("tags") or {}).items():
+            for value in values if isinstance(values, list) else [values]:
+                groups.append(f"tag_{value}" if key == "labels" else f"tag_{key}_{value}")
+        if device.get("larUid"):
+            groups.append(f"lar_{device.get('larUid')}")
+        for group in groups:
+            group = self.inventory.add_group(self._sanitize_group_name(group))
+            self.inventory.add_child(group, host)
+
+        strict = self.get_option("strict")
+        hostvars = self.inventory.get_host(host).get_vars()
+        self._set_composite_vars(self.get_option("compose"), hostvars, host, strict=strict)
+        self._add_host_to_composed_groups(self.get_option("groups"), hostvars, host, strict=strict)
+        self._add_host_to_keyed_groups(self.get_option("keyed_groups"), hostvars, host, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option("cache") and cache
+        update_cache = self.get_option("cache") and not cache
+        devices = None
+        if use_cache:
+            try:
+                devices = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+        if devices is None:
+            devices = self.fetch_devices()
+        if update_cache:
+            self._cache[cache_key] = devices
+
+        for device in devices:
+            self.add_device(device)
@@ -7,11 +7,53 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import fcntl
+import hashlib
+import json
+import os
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from enum import Enum
 from functools import wraps
+from time import sleep, time
+from .metrics import CDOMetrics
+from .profiling import span
 from .errors import DuplicateObject, APIError, DeviceNotFound, CredentialsFailure
 
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def decode_json(content: bytes):
+    """Decode a JSON response body, with orjson when it is installed and the stdlib json module otherwise"""
+    if HAS_ORJSON:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def iter_json_items(response: requests.Response):
+    """Yield the items of a streamed JSON array response one at a time. With ijson the array is parsed as it is read
+    off the socket, otherwise the body is read and decoded whole. The response is closed when the items run out or
+    the consumer stops early."""
+    # ijson is only needed for streamed calls, so it is not imported before one is made
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    with response:
+        if ijson is not None:
+            response.raw.decode_content = True
+            yield from ijson.items(response.raw, "item", use_float=True)
+        elif response.content:
+            yield from decode_json(response.content)
+
 
 class CDORegions(Enum):
     """CDO API Endpoints by Region"""
@@ -26,48 +68,221 @@ class CDORegions(Enum):
         return region[input_region].value
 
 
+@dataclass
+class CDORetryPolicy:
+    """When and how long to back off before retrying a throttled (429) or failed (5xx) API call"""
+
+    retries: int = 3
+    budget: float = 60
+    backoff: float = 0.5
+    max_backoff: float = 30
+    methods: tuple = ("GET", "PUT", "DELETE")
+    statuses: tuple = (429, 500, 502, 503, 504)
+
+    def next_delay(self, method: str, attempt: int, response: requests.Response, slept: float) -> float | None:
+        """Return the seconds to wait before the next attempt, or None if the call should not be retried"""
+        if method not in self.methods or attempt >= self.retries:
+            return None
+        if response is not None and response.status_code not in self.statuses:
+            return None
+        delay = self.retry_after(response)
+        if delay is None:
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        if slept + delay > self.budget:
+            return None
+        return delay
+
+    @staticmethod
+    def retry_after(response: requests.Response) -> float | None:
+        """Return the wait requested by the Retry-After header (delta-seconds or HTTP-date), if any"""
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+            except (TypeError, ValueError):
+                return None
+
+
+class CDORateLimiter:
+    """Client side token bucket shared by every process on this control node that talks to the same tenant in the
+    same region. The bucket lives in a small JSON file guarded by flock so that all forks draw on one request budget.
+    """
+
+    def __init__(self, key: str, rate: float, burst: int = None, directory: str = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        directory = directory or os.path.expanduser("~/.ansible/tmp")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"cdo-ratelimit-{key}.json")
+
+    def acquire(self) -> float:
+        """Block until a request token is available and return the number of seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return waited
+            sleep(wait)
+            waited += wait
+
+    def _take(self) -> float:
+        """Refill the shared bucket and take a token from it, or return how long until one is available"""
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time()
+                tokens = state.get("tokens", self.burst) + (now - state.get("updated", now)) * self.rate
+                tokens = min(self.burst, tokens)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+                if wait == 0:
+                    tokens -= 1
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+
 class CDOAPIWrapper(object):
     """This decorator class wraps all API methods of ths client and solves a number of issues. For example, if an
     object already exists when attempting to create an object, raise the custom error 'CDODuplicateDevice' and give
     the consumer the opportunity to ignore the error and carry on with other operations in their script.
+    Calls are paced by the rate_limiter of the http session (first argument), and throttled or failed calls are
+    retried according to its retry_policy. Retries and the time spent waiting are recorded in its metrics, if any.
     Note that the repsone from the API calls are a tuple. Example:
     (400, {'errorCode': 'abc123', 'errorMessage': 'error text', 'errorType': 'error type', 'furtherDetails': None})
     """
 
+    def __init__(self, method: str = "GET"):
+        self.method = method
+
     # Add handler for bad certificate
     def __call__(self, fn):
         @wraps(fn)
         def new_func(*args, **kwargs):
+            retry_policy = getattr(args[0], "retry_policy", None) if args else None
+            rate_limiter = getattr(args[0], "rate_limiter", None) if args else None
+            metrics = getattr(args[0], "metrics", None) if args else None
+            with span(f"{self.method} {str(kwargs.get('path') or '').split('?')[0]}"):
+                return self.call(fn, args, kwargs, retry_policy, rate_limiter, metrics)
+
+        return new_func
+
+    def call(self, fn, args: tuple, kwargs: dict, retry_policy, rate_limiter, metrics):
+        """Make the API call, pacing it with the rate limiter and retrying it as the retry policy allows"""
+        attempt, slept = 0, 0.0
+        while True:
+            if rate_limiter is not None:
+                waited = rate_limiter.acquire()
+                if metrics is not None and waited:
+                    metrics.sleep("rate_limit", waited)
             try:
                 return fn(*args, **kwargs)
-            except requests.HTTPError as ex:
-                if ex.response.status_code == 404:
-                    raise DeviceNotFound("404 Device Not Found")
-                elif ex.response.status_code == 401:
-                    raise CredentialsFailure("API Key was rejected by CDO API")
-                elif ex.response.status_code in range(400, 600):
-                    if "Duplicate" in ex.response.text:
-                        raise DuplicateObject(ex.response.text)
-                    else:
-                        raise APIError(ex)
+            except (requests.HTTPError, requests.ConnectionError) as ex:
+                delay = None
+                if retry_policy is not None:
+                    delay = retry_policy.next_delay(self.method, attempt, ex.response, slept)
+                if delay is None:
+                    self.raise_error(ex)
+                sleep(delay)
+                if metrics is not None:
+                    metrics.retry(self.method, ex.request.url if ex.request is not None else "", delay)
+                slept += delay
+                attempt += 1
 
-        return new_func
+    @staticmethod
+    def raise_error(ex: requests.RequestException):
+        """Translate a failed API call into the matching collection exception"""
+        if not isinstance(ex, requests.HTTPError):
+            raise ex
+        if ex.response.status_code == 404:
+            raise DeviceNotFound("404 Device Not Found")
+        elif ex.response.status_code == 401:
+            raise CredentialsFailure("API Key was rejected by CDO API")
+        elif ex.response.status_code in range(400, 600):
+            if "Duplicate" in ex.response.text:
+                raise DuplicateObject(ex.response.text)
+            else:
+                raise APIError(ex)
 
 
 class CDORequests:
     @staticmethod
-    def create_session(token: str, version: str) -> str:
-        """Helper function to set the auth token and accept headers in the API request"""
-        http_session = requests.Session()
+    def create_session(
+        token: str, version: str, endpoint: str = None, options: dict = None, socket_path: str = None
+    ) -> requests.Session:
+        """Helper function to set the auth token and accept headers in the API request. Connections to the CDO
+        endpoint are pooled and kept alive for the life of the session so that concurrent requests reuse sockets.
+        Given the socket_path of a cisco.cdo httpapi connection, requests are sent over the session kept open by
+        the persistent connection daemon instead. The connection then holds the API key, and endpoint should be its
+        host so that the caches are keyed on the tenant the requests actually go to."""
+        options = options or {}
+        if socket_path:
+            if token:
+                raise ValueError("The API key of a session over the httpapi connection is held by the connection")
+            from .connection import CDOConnectionSession
+
+            http_session = CDOConnectionSession(socket_path)
+        else:
+            http_session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=options.get("pool_connections") or 1,
+                pool_maxsize=options.get("pool_maxsize") or 10,
+                pool_block=bool(options.get("pool_block")),
+            )
+            http_session.mount(f"https://{endpoint}" if endpoint else "https://", adapter)
         http_session.headers = {
-            "Authorization": f"Bearer {token.strip()}",
             "Accept": "*/*",
             "Content-Type": "application/json",
             "User-Agent": f"AnsibleCDOModule/{version}",
         }
+        if token:
+            http_session.headers["Authorization"] = f"Bearer {token.strip()}"
+        http_session.retry_policy = CDORetryPolicy(
+            retries=options.get("retries", 3),
+            budget=options.get("retry_budget", 60),
+            methods=tuple(options.get("retry_methods") or CDORetryPolicy.methods),
+        )
+        # Never put the API key itself on disk, the tenant is identified by a digest of it
+        if socket_path:
+            http_session.tenant_key = http_session.connection.tenant_key()
+        else:
+            http_session.tenant_key = hashlib.sha256(token.strip().encode()).hexdigest()[:16]
+        if options.get("rate_limit"):
+            http_session.rate_limiter = CDORateLimiter(
+                f"{endpoint}-{http_session.tenant_key}", options.get("rate_limit"), options.get("rate_burst")
+            )
+        if options.get("metrics"):
+            http_session.metrics = CDOMetrics()
+            http_session.hooks["response"].append(http_session.metrics.response_hook)
+        http_session.cache_path = options.get("cache_path")
+        if options.get("cache_ttl"):
+            from .cache import CDOInventoryCache
+
+            http_session.inventory_cache = CDOInventoryCache(options.get("cache_path"), options.get("cache_ttl"))
+            if options.get("cache_refresh"):
+                http_session.inventory_cache.invalidate(f"{endpoint}-{http_session.tenant_key}")
+        if options.get("lookup_cache_ttl"):
+            from .cache import CDOLookupCache
+
+            http_session.lookup_cache = CDOLookupCache(options.get("cache_path"), options.get("lookup_cache_ttl"))
+            if options.get("cache_refresh"):
+                http_session.lookup_cache.invalidate(f"{endpoint}-{http_session.tenant_key}")
         return http_session
 
-    @CDOAPIWrapper()
+    @CDOAPIWrapper(method="GET")
     @staticmethod
     def get(http_session: requests.Session, url: str, path: str = None, query: dict = None) -> str:
         """Given the CDO endpoint, path, and query, return the json payload from the API"""
@@ -80,36 +295,68 @@ class CDORequests:
             params=query,
         )
         result.raise_for_status()
-        if result.text:
-            return result.json()
+        if result.content:
+            return decode_json(result.content)
         else:
             return result.text
 
-    @CDOAPIWrapper()
+    @CDOAPIWrapper(method="GET")
+    @staticmethod
+    def get_stream(http_session: requests.Session, url: str, path: str = None, query: dict = None) -> requests.Response:
+        """Given the CDO endpoint, path, and query, return the response with its body still unread"""
+        uri = url if path is None else f"{url}/{path}"
+        result = http_session.get(url=uri, headers=http_session.headers, params=query, stream=True)
+        if result.status_code >= 400:
+            # Read the error body so it can be reported, which also returns the connection to the pool
+            result.content
+        result.raise_for_status()
+        return result
+
+    @staticmethod
+    def get_items(http_session: requests.Session, url: str, path: str = None, query: dict = None):
+        """Given the CDO endpoint, path, and query, yield the items of the JSON array returned as they are parsed"""
+        yield from iter_json_items(CDORequests.get_stream(http_session, url, path=path, query=query))
+
+    @CDOAPIWrapper(method="GET")
+    @staticmethod
+    def get_conditional(
+        http_session: requests.Session, url: str, path: str = None, query: dict = None, etag: str = None
+    ) -> tuple:
+        """Conditional GET. Return (status code, etag, json payload); a 304 means the given etag is still current and
+        the payload is None"""
+        uri = url if path is None else f"{url}/{path}"
+        headers = http_session.headers | {"If-None-Match": etag} if etag else http_session.headers
+        result = http_session.get(url=uri, headers=headers, params=query)
+        result.raise_for_status()
+        if result.status_code == 304:
+            return result.status_code, etag, None
+        return result.status_code, result.headers.get("ETag"), decode_json(result.content) if result.content else []
+
+    @CDOAPIWrapper(method="POST")
     @staticmethod
     def post(http_session: requests.Session, url: str, path: str = None, data: dict = None, query: dict = None) -> str:
         """Given the CDO endpoint, path, and query, post the json data and return the json payload from the API"""
         uri = url if path is None else f"{url}/{path}"
         result = http_session.post(url=uri, params=query, json=data)
         result.raise_for_status()
-        if result.text and result.status_code in range(200, 300):
-            return result.json()
+        if result.content and result.status_code in range(200, 300):
+            return decode_json(result.content)
         else:
             return
 
-    @CDOAPIWrapper()
+    @CDOAPIWrapper(method="PUT")
     @staticmethod
     def put(http_session: requests.Session, url: str, path: str = None, data: dict = None, query: dict = None) -> str:
         """Given the CDO endpoint, path, and query, return the json payload from the API"""
         uri = url if path is None else f"{url}/{path}"
         result = http_session.put(url=uri, headers=http_session.headers, params=query, json=data)
         result.raise_for_status()
-        if result.text and result.status_code in range(200, 300):
-            return result.json()
+        if result.content and result.status_code in range(200, 300):
+            return decode_json(result.content)
         else:
             return
 
-    @CDOAPIWrapper()
+    @CDOAPIWrapper(method="DELETE")
     @staticmethod
     def delete(http_session: requests.Session, url: str, path: str = None) -> int:
         result = http_session.delete(url=f"{url}/{path}", headers=http_session.headers)
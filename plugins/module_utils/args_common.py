@@ -7,21 +7,66 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+from ansible.module_utils.basic import env_fallback
+
 #############################
 # Common to all modules
 COMMON_SPEC = {
-    "api_key": {"required": True, "type": "str", "no_log": True},
+    "api_key": {"required": False, "type": "str", "no_log": True},
     "region": {"default": "us", "choices": ["us", "eu", "apj"], "type": "str"},
+    "pool_connections": {"default": 1, "type": "int"},
+    "pool_maxsize": {"default": 10, "type": "int"},
+    "pool_block": {"default": False, "type": "bool"},
+    "retries": {"default": 3, "type": "int"},
+    "retry_budget": {"default": 60, "type": "int"},
+    "retry_methods": {
+        "default": ["GET", "PUT", "DELETE"],
+        "type": "list",
+        "elements": "str",
+        "choices": ["GET", "POST", "PUT", "DELETE"],
+    },
+    "rate_limit": {"type": "float"},
+    "rate_burst": {"type": "int"},
+    "cache_ttl": {"default": 0, "type": "int"},
+    "cache_path": {"default": "~/.ansible/tmp/cdo_cache.db", "type": "str"},
+    "lookup_cache_ttl": {"default": 0, "type": "int"},
+    "cache_refresh": {"default": False, "type": "bool"},
+    "metrics": {"default": False, "type": "bool"},
+    "profile": {"choices": ["cprofile", "trace"], "type": "str"},
+    "profile_path": {
+        "default": "~/.ansible/tmp/cdo-profiles",
+        "fallback": (env_fallback, ["CDO_PROFILE_PATH"]),
+        "type": "str",
+    },
 }
 
 #############################
 # Inventory
+ASA_IOS_OPTIONS = {
+    "device_name": {"required": True, "type": "str"},
+    "ipv4": {"type": "str"},
+    "mgmt_port": {"default": 443, "type": "int"},
+    "sdc": {"type": "str"},
+    "username": {"type": "str"},
+    "password": {"type": "str"},
+    "ignore_cert": {"default": False, "type": "bool"},
+    "device_type": {"default": "asa", "choices": ["asa", "ios"], "type": "str"},
+    "retry": {"default": 10, "type": "int"},
+    "delay": {"default": 1, "type": "int"},
+}
+
 INVENTORY_ARGUMENT_SPEC = COMMON_SPEC | {
     "gather": {
         "type": "dict",
         "options": {
             "filter": {"type": "str"},
             "device_type": {"default": "all", "choices": ["all", "asa", "ios", "ftd", "fmc"]},
+            "page_size": {"default": 50, "type": "int"},
+            "max_items": {"type": "int"},
+            "workers": {"default": 4, "type": "int"},
+            "fields": {"default": ["full"], "type": "list", "elements": "str"},
+            "incremental": {"default": False, "type": "bool"},
+            "stream": {"default": False, "type": "bool"},
         },
     },
     "add": {
@@ -48,22 +93,11 @@ INVENTORY_ARGUMENT_SPEC = COMMON_SPEC | {
                     "serial": {"type": "str"},
                     "password": {"type": "str"},
                 },
+                "required_if": [["onboard_method", "ltp", ["serial"]]],
             },
-            "asa_ios": {
-                "type": "dict",
-                "options": {
-                    "device_name": {"required": True, "type": "str"},
-                    "ipv4": {"type": "str"},
-                    "mgmt_port": {"default": 443, "type": "int"},
-                    "sdc": {"type": "str"},
-                    "username": {"type": "str"},
-                    "password": {"type": "str"},
-                    "ignore_cert": {"default": False, "type": "bool"},
-                    "device_type": {"default": "asa", "choices": ["asa", "ios"], "type": "str"},
-                    "retry": {"default": 10, "type": "int"},
-                    "delay": {"default": 1, "type": "int"},
-                },
-            },
+            "asa_ios": {"type": "dict", "options": ASA_IOS_OPTIONS},
+            "devices": {"type": "list", "elements": "dict", "options": ASA_IOS_OPTIONS},
+            "workers": {"default": 10, "type": "int"},
         },
     },
     "delete": {
@@ -128,6 +162,17 @@ DEPLOY_ARGUMENT_SPEC = COMMON_SPEC | {
             "interval": {"default": 2, "type": "int"},
         },
     },
+    "bulk_deploy": {
+        "type": "dict",
+        "options": {
+            "device_type": {"default": "all", "choices": ["all", "asa", "ios"], "type": "str"},
+            "device_names": {"type": "list", "elements": "str"},
+            "tags": {"type": "list", "elements": "str"},
+            "batch_size": {"default": 50, "type": "int"},
+            "timeout": {"default": 20, "type": "int"},
+            "interval": {"default": 2, "type": "int"},
+        },
+    },
     "pending": {
         "type": "dict",
         "options": {
@@ -135,10 +180,12 @@ DEPLOY_ARGUMENT_SPEC = COMMON_SPEC | {
             "device_name": {"type": "str"},
             "limit": {"default": 50, "type": "int"},
             "offset": {"default": 0, "type": "int"},
+            "page_size": {"default": 50, "type": "int"},
+            "summary": {"default": False, "type": "bool"},
         },
     },
 }
-DEPLOY_MUTUALLY_REQUIRED_ONE_OF = ["deploy", "pending"]
+DEPLOY_MUTUALLY_REQUIRED_ONE_OF = ["deploy", "bulk_deploy", "pending"]
 DEPLOY_MUTUALLY_EXCLUSIVE = []
 DEPLOY_REQUIRED_TOGETHER = []
 DEPLOY_REQUIRED_IF = []
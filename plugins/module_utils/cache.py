@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+import os
+import sqlite3
+from time import time
+
+DEFAULT_CACHE_PATH = "~/.ansible/tmp/cdo_cache.db"
+
+# Process wide layer of CDOLookupCache: {(tenant, key): (expires_at, value)}
+_lookups = dict()
+
+
+class CDOInventoryCache:
+    """SQLite backed copy of a tenant's device inventory shared by all tasks on the control node. The inventory is
+    stored page by page together with the ETag CDO returned for each page so that a stale copy can be revalidated
+    with conditional GETs instead of being downloaded again."""
+
+    def __init__(self, path: str = None, ttl: int = 300):
+        self.path = os.path.expanduser(path or DEFAULT_CACHE_PATH)
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_pages "
+                "(tenant TEXT, page_offset INTEGER, etag TEXT, devices TEXT, PRIMARY KEY (tenant, page_offset))"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS inventory_meta (tenant TEXT PRIMARY KEY, fetched_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def is_fresh(self, fetched_at: float) -> bool:
+        """Return True if a copy fetched at fetched_at may be used without revalidation"""
+        return fetched_at is not None and time() - fetched_at < self.ttl
+
+    def load(self, tenant: str) -> tuple:
+        """Return (fetched_at, pages) for the tenant, where pages is a list of {offset, etag, devices} dicts"""
+        with self._connect() as db:
+            row = db.execute("SELECT fetched_at FROM inventory_meta WHERE tenant = ?", (tenant,)).fetchone()
+            pages = db.execute(
+                "SELECT page_offset, etag, devices FROM inventory_pages WHERE tenant = ? ORDER BY page_offset",
+                (tenant,),
+            ).fetchall()
+        return (
+            row[0] if row else None,
+            [{"offset": offset, "etag": etag, "devices": json.loads(devices)} for offset, etag, devices in pages],
+        )
+
+    def store(self, tenant: str, pages: list):
+        """Replace the cached inventory of the tenant with the given pages"""
+        with self._connect() as db:
+            db.execute("DELETE FROM inventory_pages WHERE tenant = ?", (tenant,))
+            db.executemany(
+                "INSERT INTO inventory_pages (tenant, page_offset, etag, devices) VALUES (?, ?, ?, ?)",
+                [(tenant, page["offset"], page["etag"], json.dumps(page["devices"])) for page in pages],
+            )
+            db.execute("INSERT OR REPLACE INTO inventory_meta (tenant, fetched_at) VALUES (?, ?)", (tenant, time()))
+
+    def update(self, tenant: str, added: list = None, removed: list = None):
+        """Edit the cached inventory of the tenant in place after devices were added or deleted, keeping the time it
+        was fetched at. The pages that change lose their ETag so that they are downloaded again on revalidation. The
+        edit is one transaction, so that concurrent tasks do not undo each other's changes."""
+        removed = set(removed or [])
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            pages = db.execute(
+                "SELECT page_offset, devices FROM inventory_pages WHERE tenant = ? ORDER BY page_offset", (tenant,)
+            ).fetchall()
+            if not pages:
+                return
+            edited = dict()
+            for offset, devices in pages:
+                devices = json.loads(devices)
+                kept = [device for device in devices if device.get("uid") not in removed]
+                if len(kept) < len(devices):
+                    edited[offset] = kept
+            if added:
+                offset = pages[-1][0]
+                edited[offset] = edited.get(offset, json.loads(pages[-1][1])) + list(added)
+            db.executemany(
+                "UPDATE inventory_pages SET etag = NULL, devices = ? WHERE tenant = ? AND page_offset = ?",
+                [(json.dumps(devices), tenant, offset) for offset, devices in edited.items()],
+            )
+
+    def invalidate(self, tenant: str):
+        """Force the next lookup for the tenant to revalidate against CDO"""
+        with self._connect() as db:
+            db.execute("DELETE FROM inventory_meta WHERE tenant = ?", (tenant,))
+
+
+class CDOInventorySnapshot:
+    """SQLite backed snapshot of the devices returned by one inventory query of a tenant, with the high-water mark
+    (latest device modification timestamp) it is current to, so that later runs only fetch what changed since."""
+
+    def __init__(self, path: str = None):
+        self.path = os.path.expanduser(path or DEFAULT_CACHE_PATH)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_snapshots "
+                "(tenant TEXT, query TEXT, uid TEXT, device TEXT, PRIMARY KEY (tenant, query, uid))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_snapshot_meta "
+                "(tenant TEXT, query TEXT, high_water_mark INTEGER, PRIMARY KEY (tenant, query))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, tenant: str, query: str) -> tuple:
+        """Return (high_water_mark, {uid: device}) of the snapshot, or (None, {}) if there is none"""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT high_water_mark FROM inventory_snapshot_meta WHERE tenant = ? AND query = ?", (tenant, query)
+            ).fetchone()
+            devices = db.execute(
+                "SELECT uid, device FROM inventory_snapshots WHERE tenant = ? AND query = ?", (tenant, query)
+            ).fetchall()
+        return (row[0] if row else None, {uid: json.loads(device) for uid, device in devices})
+
+    def store(self, tenant: str, query: str, high_water_mark: int, devices: dict):
+        """Replace the snapshot with the given {uid: device} and high-water mark"""
+        with self._connect() as db:
+            db.execute("DELETE FROM inventory_snapshots WHERE tenant = ? AND query = ?", (tenant, query))
+            db.executemany(
+                "INSERT INTO inventory_snapshots (tenant, query, uid, device) VALUES (?, ?, ?, ?)",
+                [(tenant, query, uid, json.dumps(device)) for uid, device in devices.items()],
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO inventory_snapshot_meta (tenant, query, high_water_mark) VALUES (?, ?, ?)",
+                (tenant, query, high_water_mark),
+            )
+
+
+class CDOLookupCache:
+    """Memoizes tenant constant lookups (the cdFMC, its specific device, access policies...) for ttl seconds, both in
+    this process and, through SQLite, across the tasks of a run."""
+
+    def __init__(self, path: str = None, ttl: int = 300):
+        self.path = os.path.expanduser(path or DEFAULT_CACHE_PATH)
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS lookups "
+                "(tenant TEXT, key TEXT, expires_at REAL, value TEXT, PRIMARY KEY (tenant, key))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, tenant: str, key: str):
+        """Return the cached value, or None if it is missing or expired"""
+        expires_at, value = _lookups.get((tenant, key), (0, None))
+        if expires_at > time():
+            return value
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT expires_at, value FROM lookups WHERE tenant = ? AND key = ?", (tenant, key)
+            ).fetchone()
+        if row is None or row[0] <= time():
+            return None
+        _lookups[(tenant, key)] = (row[0], json.loads(row[1]))
+        return _lookups[(tenant, key)][1]
+
+    def set(self, tenant: str, key: str, value):
+        """Cache value for ttl seconds"""
+        expires_at = time() + self.ttl
+        _lookups[(tenant, key)] = (expires_at, value)
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO lookups (tenant, key, expires_at, value) VALUES (?, ?, ?, ?)",
+                (tenant, key, expires_at, json.dumps(value)),
+            )
+
+    def invalidate(self, tenant: str, key: str = None):
+        """Drop one cached lookup of the tenant, or all of them when no key is given"""
+        for cached in [cached for cached in _lookups if cached[0] == tenant and key in (None, cached[1])]:
+            del _lookups[cached]
+        with self._connect() as db:
+            if key is None:
+                db.execute("DELETE FROM lookups WHERE tenant = ?", (tenant,))
+            else:
+                db.execute("DELETE FROM lookups WHERE tenant = ? AND key = ?", (tenant, key))
@@ -8,12 +8,19 @@ from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
 from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
-from ansible_collections.cisco.cdo.plugins.module_utils.query import CDOQuery
+from ansible_collections.cisco.cdo.plugins.module_utils.query import CDOQuery, INDEX_FIELDS, MODIFIED_FIELD
+from ansible_collections.cisco.cdo.plugins.module_utils.device_index import DeviceIndex, LARIndex
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import DeviceNotFound, ObjectNotFound
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import urllib.parse
 import requests
 
+DEFAULT_PAGE_SIZE = 50
+# Devices per page of the inventory cache, whose devices only carry the few INDEX_FIELDS
+INDEX_PAGE_SIZE = 200
+
 
 def get_lar_list(module_params: dict, http_session: requests.session, endpoint: str):
     """Return a list of lars (SDC/CDG from CDO)"""
@@ -24,11 +31,25 @@ def get_lar_list(module_params: dict, http_session: requests.session, endpoint:
     return CDORequests.get(http_session, f"https://{endpoint}", path=path)
 
 
+def lar_index(http_session: requests.session, endpoint: str) -> LARIndex:
+    """Return the LARIndex over every lar of the tenant. The lar listing is read once per session and cached as a
+    tenant constant when a lookup cache is configured"""
+    if getattr(http_session, "lar_index", None) is None:
+        lars = cached_lookup(http_session, endpoint, "lars", lambda: get_lar_list({}, http_session, endpoint))
+        http_session.lar_index = LARIndex(lars)
+    return http_session.lar_index
+
+
+def find_lars(module_params: dict, http_session: requests.session, endpoint: str) -> list:
+    """Return the lars (SDC/CDG) whose name or ipv4 is module_params sdc, or every lar when no sdc is given"""
+    return lar_index(http_session, endpoint).lookup(module_params.get("sdc"))
+
+
 def inventory_count(http_session: requests.session, endpoint: str, filter: str = None):
     """Given a filter criteria, return the number of devices that match the criteria"""
-    return CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}?agg=count&q={filter}")[
-        "aggregationQueryResult"
-    ]
+    return CDORequests.get(
+        http_session, f"https://{endpoint}", path=CDOAPI.DEVICES.value, query={"agg": "count", "q": filter}
+    )["aggregationQueryResult"]
 
 
 def get_specific_device(http_session: requests.session, endpoint: str, uid: str) -> str:
@@ -42,13 +63,60 @@ def get_device(http_session: requests.session, endpoint: str, uid: str):
     return CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}/{uid}")
 
 
+def cached_lookup(http_session: requests.session, endpoint: str, key: str, fetch):
+    """Return the tenant constant value cached under key, calling fetch() to look it up on a miss. Without a lookup
+    cache configured on the session this is just fetch()"""
+    lookup_cache = getattr(http_session, "lookup_cache", None)
+    if lookup_cache is None:
+        return fetch()
+    tenant = f"{endpoint}-{http_session.tenant_key}"
+    value = lookup_cache.get(tenant, key)
+    if value is None:
+        value = fetch()
+        lookup_cache.set(tenant, key, value)
+    return value
+
+
+def invalidate_lookup(http_session: requests.session, endpoint: str, key: str = None):
+    """Drop a cached tenant lookup (or all of them) so that the next call fetches it again"""
+    if getattr(http_session, "lookup_cache", None) is not None:
+        http_session.lookup_cache.invalidate(f"{endpoint}-{http_session.tenant_key}", key)
+
+
 def get_cdfmc(http_session: requests.session, endpoint: str):
     """Get the cdFMC object for this tenant if one exists"""
-    query = CDOQuery.get_cdfmc_query()
-    response = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}?q={query['q']}")
-    if len(response) == 0:
-        raise DeviceNotFound("A cdFMC was not found in this tenant")
-    return response[0]
+
+    def fetch() -> dict:
+        query = CDOQuery.get_cdfmc_query()
+        response = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}?q={query['q']}")
+        if len(response) == 0:
+            raise DeviceNotFound("A cdFMC was not found in this tenant")
+        return response[0]
+
+    return cached_lookup(http_session, endpoint, "cdfmc", fetch)
+
+
+def get_cdfmc_specific_device(http_session: requests.session, endpoint: str, cdfmc: dict) -> dict:
+    """Given the cdFMC, retreive its specific device (domain uid etc.)"""
+    return cached_lookup(
+        http_session,
+        endpoint,
+        f"cdfmc_specific_device:{cdfmc['uid']}",
+        lambda: get_specific_device(http_session, endpoint, cdfmc["uid"]),
+    )
+
+
+def get_objects_by_uid(http_session: requests.session, endpoint: str, path: str, uids: list) -> dict:
+    """Return {uid: object} for the given uids of the collection at path, using one query per page of uids"""
+    if len(uids) == 1:
+        return {uids[0]: CDORequests.get(http_session, f"https://{endpoint}", path=f"{path}/{uids[0]}")}
+    objects = dict()
+    for start in range(0, len(uids), DEFAULT_PAGE_SIZE):
+        batch = uids[start : start + DEFAULT_PAGE_SIZE]
+        query = {"q": " OR ".join(f"(uid:{uid})" for uid in batch), "limit": len(batch), "offset": 0}
+        for obj in CDORequests.get(http_session, f"https://{endpoint}", path=path, query=query) or []:
+            objects[obj["uid"]] = obj
+    return objects
 
 
 def working_set(http_session: requests.session, endpoint: str, uid: str):
@@ -60,20 +128,228 @@ def working_set(http_session: requests.session, endpoint: str, uid: str):
     return CDORequests.post(http_session, f"https://{endpoint}", path=f"{CDOAPI.WORKSET.value}", data=data)
 
 
-def gather_inventory(
-    module_params: dict,
+def iter_pages(
     http_session: requests.session,
     endpoint: str,
-    limit: int = 50,
+    path: str,
+    query: dict = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    max_items: int = None,
     offset: int = 0,
-) -> str:
+    count: int = None,
+    workers: int = 1,
+    fetch=None,
+):
+    """Walk a CDO collection with limit/offset, yielding one page (list) at a time until an empty page marks the end
+    of the collection or max_items is reached. CDO may return fewer items than the limit asked for, so the next page
+    always starts after the items actually received and a short page does not end the walk. When the collection
+    size (count) is known up front, every page offset is planned and the pages are fetched concurrently on a pool of
+    workers, but still yielded in order. A planned page that comes back short leaves a gap before the next one,
+    which is walked sequentially from the offset actually reached. As count was taken before the walk, the pages
+    past it are then read one by one until an empty page comes back. Pages are read with fetch(offset, limit) when
+    given, otherwise with a GET of path and query.
+
+    requests does not guarantee that a Session is thread-safe. The workers share the http_session on the assumption
+    that nothing changes its headers, cookies or mounted adapters during the walk: they only send requests through
+    it, and the connection pool of its adapter is itself thread-safe."""
+
+    def fetch_page(page_offset: int, limit: int) -> list:
+        if fetch is not None:
+            return fetch(page_offset, limit)
+        page_query = (query or {}) | {"limit": limit, "offset": page_offset}
+        return CDORequests.get(http_session, f"https://{endpoint}", path=path, query=page_query)
+
+    fetched = 0
+    if count is not None and workers > 1:
+        total = count if max_items is None else min(count, max_items)
+        end = offset + total
+        pages = [(page_offset, min(page_size, end - page_offset)) for page_offset in range(offset, end, page_size)]
+        reached = offset
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (page_offset, limit), page in zip(pages, pool.map(lambda page: fetch_page(*page), pages)):
+                reached = page_offset
+                while page:
+                    yield page
+                    reached += len(page)
+                    if reached >= page_offset + limit:
+                        break
+                    page = fetch_page(reached, page_offset + limit - reached)
+        if reached < end:
+            # The collection ended before the count taken at the start of the walk
+            return
+        fetched, offset = total, end
+
+    while max_items is None or fetched < max_items:
+        limit = page_size if max_items is None else min(page_size, max_items - fetched)
+        page = fetch_page(offset, limit)
+        if not page:
+            return
+        yield page
+        fetched += len(page)
+        offset += len(page)
+
+
+def iter_items(
+    http_session: requests.session,
+    endpoint: str,
+    path: str,
+    query: dict = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    max_items: int = None,
+    offset: int = 0,
+):
+    """Walk a CDO collection with limit/offset like iter_pages, but yield one item at a time as each page is parsed
+    off the wire, so that the first items are available before a large page has been downloaded. The walk ends on
+    an empty page, not on a short one."""
+    fetched = 0
+    while max_items is None or fetched < max_items:
+        limit = page_size if max_items is None else min(page_size, max_items - fetched)
+        page_query = (query or {}) | {"limit": limit, "offset": offset}
+        received = 0
+        for item in CDORequests.get_items(http_session, f"https://{endpoint}", path=path, query=page_query):
+            received += 1
+            yield item
+        if not received:
+            return
+        fetched += received
+        offset += received
+
+
+def iter_inventory(module_params: dict, http_session: requests.session, endpoint: str):
+    """Stream the CDO inventory, yielding one device at a time and fetching the next page on demand"""
+    query = CDOQuery.get_inventory_query(module_params)
+    if module_params.get("stream"):
+        yield from iter_items(
+            http_session,
+            endpoint,
+            CDOAPI.DEVICES.value,
+            query={"q": query["q"], "resolve": query["r"]},
+            page_size=module_params.get("page_size") or DEFAULT_PAGE_SIZE,
+            max_items=module_params.get("max_items"),
+        )
+        return
+    # Over the httpapi connection the pages are sent one at a time whatever the number of workers
+    workers = 1 if getattr(http_session, "serial", False) else module_params.get("workers") or 1
+    count = inventory_count(http_session, endpoint, filter=query["q"]) if workers > 1 else None
+    for page in iter_pages(
+        http_session,
+        endpoint,
+        CDOAPI.DEVICES.value,
+        query={"q": query["q"], "resolve": query["r"]},
+        page_size=module_params.get("page_size") or DEFAULT_PAGE_SIZE,
+        max_items=module_params.get("max_items"),
+        count=count,
+        workers=workers,
+    ):
+        yield from page
+
+
+def gather_inventory(module_params: dict, http_session: requests.session, endpoint: str) -> list:
     """Get CDO inventory"""
-    # TODO: Support paging
+    if module_params.get("incremental"):
+        return incremental_inventory(module_params, http_session, endpoint)
+    return list(iter_inventory(module_params, http_session, endpoint))
+
+
+def incremental_inventory(module_params: dict, http_session: requests.session, endpoint: str) -> list:
+    """Bring a local snapshot of the inventory up to date and return it. Only the devices modified since the
+    snapshot's high-water mark are downloaded, and deleted devices are found with a uid-only listing. max_items is
+    ignored: a truncated snapshot would never be filled in by the later runs."""
+    module_params = module_params | {
+        "fields": (module_params.get("fields") or ["full"]) + ["uid", MODIFIED_FIELD],
+        "max_items": None,
+    }
     query = CDOQuery.get_inventory_query(module_params)
-    q = urllib.parse.quote_plus(query["q"])
-    r = urllib.parse.quote_plus(query["r"])
-    path = f"{CDOAPI.DEVICES.value}?limit={limit}&offset={offset}&q={q}&resolve={r}"
-    return CDORequests.get(http_session, f"https://{endpoint}", path=path)
+    from ansible_collections.cisco.cdo.plugins.module_utils.cache import CDOInventorySnapshot
+
+    snapshot = CDOInventorySnapshot(getattr(http_session, "cache_path", None))
+    tenant = f"{endpoint}-{http_session.tenant_key}"
+    query_key = hashlib.sha256(f"{query['q']}|{query['r']}".encode()).hexdigest()
+    high_water_mark, devices = snapshot.load(tenant, query_key)
+
+    if high_water_mark is None:
+        devices = {device["uid"]: device for device in iter_inventory(module_params, http_session, endpoint)}
+    else:
+        changed = iter_inventory(module_params | {"modified_since": high_water_mark}, http_session, endpoint)
+        devices.update({device["uid"]: device for device in changed})
+        current = {
+            device["uid"]
+            for page in iter_pages(
+                http_session,
+                endpoint,
+                CDOAPI.DEVICES.value,
+                query={"q": query["q"], "resolve": "[targets/devices.{uid}]"},
+                page_size=module_params.get("page_size") or DEFAULT_PAGE_SIZE,
+            )
+            for device in page
+        }
+        devices = {uid: device for uid, device in devices.items() if uid in current}
+
+    high_water_mark = max(
+        [device.get(MODIFIED_FIELD) for device in devices.values() if device.get(MODIFIED_FIELD)], default=None
+    )
+    snapshot.store(tenant, query_key, high_water_mark, devices)
+    return list(devices.values())
+
+
+def cached_inventory(http_session: requests.session, endpoint: str) -> list:
+    """Return the tenant inventory, reduced to the INDEX_FIELDS of each device, from the local inventory cache. A
+    stale copy is revalidated page by page with conditional GETs so that only the pages that changed are downloaded
+    again."""
+    cache = http_session.inventory_cache
+    tenant = f"{endpoint}-{http_session.tenant_key}"
+    fetched_at, pages = cache.load(tenant)
+    if cache.is_fresh(fetched_at):
+        return [device for page in pages for device in page["devices"]]
+
+    cached_pages = {page["offset"]: page for page in pages}
+    query = CDOQuery.get_inventory_query({"device_type": "all", "fields": INDEX_FIELDS})
+    pages = []
+
+    def fetch_page(offset: int, limit: int) -> list:
+        cached_page = cached_pages.get(offset, {})
+        status, etag, devices = CDORequests.get_conditional(
+            http_session,
+            f"https://{endpoint}",
+            path=CDOAPI.DEVICES.value,
+            query={"q": query["q"], "resolve": query["r"], "limit": limit, "offset": offset},
+            etag=cached_page.get("etag"),
+        )
+        if status == 304:
+            devices = cached_page["devices"]
+        if devices:
+            pages.append({"offset": offset, "etag": etag, "devices": devices})
+        return devices
+
+    for _ in iter_pages(http_session, endpoint, CDOAPI.DEVICES.value, page_size=INDEX_PAGE_SIZE, fetch=fetch_page):
+        pass
+    cache.store(tenant, pages)
+    return [device for page in pages for device in page["devices"]]
+
+
+def device_index(http_session: requests.session, endpoint: str) -> DeviceIndex:
+    """Return the DeviceIndex over the cached tenant inventory, built once per session"""
+    if getattr(http_session, "device_index", None) is None:
+        http_session.device_index = DeviceIndex(cached_inventory(http_session, endpoint))
+    return http_session.device_index
+
+
+def update_inventory(http_session: requests.session, endpoint: str, added: list = None, removed: list = None):
+    """Record the devices just added to CDO, and the uids of those just deleted, in the cached inventory of the
+    tenant so that the next lookup sees them without revalidating the whole inventory. The device index of the
+    session is dropped and rebuilt from the cache on the next lookup."""
+    http_session.device_index = None
+    if getattr(http_session, "inventory_cache", None) is not None:
+        added = [{field: device.get(field) for field in INDEX_FIELDS} for device in added or []]
+        http_session.inventory_cache.update(f"{endpoint}-{http_session.tenant_key}", added, removed)
+
+
+def find_devices(module_params: dict, http_session: requests.session, endpoint: str) -> list:
+    """Return the devices whose name, ipv4 or serial matches module_params filter, resolved locally through the
+    device index when an inventory cache is configured on the session, otherwise by an inventory query to CDO"""
+    if getattr(http_session, "inventory_cache", None) is None:
+        return gather_inventory(module_params, http_session, endpoint)
+    return device_index(http_session, endpoint).lookup(module_params.get("filter"), module_params.get("device_type"))
 
 
 def get_cdfmc_access_policy_list(
@@ -85,13 +361,64 @@ def get_cdfmc_access_policy_list(
     offset: int = 0,
     access_list_name=None,
 ):
-    """Given the domain uuid of the cdFMC, retreive the list of access policies"""
+    """Given the domain uuid of the cdFMC, retreive the list of access policies. Without an access_list_name every
+    page is read from offset, following the paging links returned by the FMC"""
     # TODO: use the FMC collection to retrieve this
     http_session.headers["fmc-hostname"] = cdfmc_host
     path = f"{CDOAPI.FMC_ACCESS_POLICY.value.replace('{domain_uid}', domain_uid)}"
-    path = f"{path}?{CDOQuery.get_cdfmc_policy_query(limit, offset, access_list_name)}"
-    response = CDORequests.get(http_session, f"https://{endpoint}", path=path)
+    response = CDORequests.get(
+        http_session,
+        f"https://{endpoint}",
+        path=f"{path}?{CDOQuery.get_cdfmc_policy_query(limit, offset, access_list_name)}",
+    )
     if response["paging"]["count"] == 0:
         if access_list_name is not None:
             raise ObjectNotFound(f"Access Policy {access_list_name} not found on cdFMC.")
+    if access_list_name is None:
+        items = response.get("items", [])
+        while response["paging"].get("next"):
+            # The FMC may return smaller pages than asked for, so the next page is wherever its link points
+            next_query = urllib.parse.urlsplit(response["paging"]["next"][0]).query
+            response = CDORequests.get(http_session, f"https://{endpoint}", path=f"{path}?{next_query}")
+            items.extend(response.get("items", []))
+        response = {"items": items, "paging": {"count": len(items), "offset": 0, "limit": len(items), "pages": 1}}
     return response
+
+
+def get_cdfmc_access_policy_index(
+    http_session: requests.session, endpoint: str, cdfmc_host: str, domain_uid: str
+) -> dict:
+    """Return {name: access policy} for every access policy of the cdFMC domain. The policies are read once per
+    session and cached as a tenant constant when a lookup cache is configured"""
+    if getattr(http_session, "access_policy_index", None) is None:
+        http_session.access_policy_index = dict()
+    if domain_uid not in http_session.access_policy_index:
+        http_session.access_policy_index[domain_uid] = cached_lookup(
+            http_session,
+            endpoint,
+            f"access_policy_index:{domain_uid}",
+            lambda: {
+                policy["name"]: policy
+                for policy in get_cdfmc_access_policy_list(http_session, endpoint, cdfmc_host, domain_uid)["items"]
+            },
+        )
+    return http_session.access_policy_index[domain_uid]
+
+
+def get_cdfmc_access_policy(
+    http_session: requests.session, endpoint: str, cdfmc_host: str, domain_uid: str, access_list_name: str
+) -> dict:
+    """Resolve an access policy by name. Without a lookup cache this is a single name query to the cdFMC. With one,
+    the policy index is used and a miss refreshes it once in case the policy was created after it was cached"""
+    if getattr(http_session, "lookup_cache", None) is None:
+        return get_cdfmc_access_policy_list(
+            http_session, endpoint, cdfmc_host, domain_uid, access_list_name=access_list_name
+        )["items"][0]
+    policies = get_cdfmc_access_policy_index(http_session, endpoint, cdfmc_host, domain_uid)
+    if access_list_name not in policies:
+        invalidate_lookup(http_session, endpoint, f"access_policy_index:{domain_uid}")
+        del http_session.access_policy_index[domain_uid]
+        policies = get_cdfmc_access_policy_index(http_session, endpoint, cdfmc_host, domain_uid)
+    if access_list_name not in policies:
+        raise ObjectNotFound(f"Access Policy {access_list_name} not found on cdFMC.")
+    return policies[access_list_name]
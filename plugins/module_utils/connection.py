@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import base64
+import io
+import requests
+from datetime import timedelta
+from requests.hooks import dispatch_hook
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from ansible.module_utils.connection import Connection, ConnectionError
+
+NETWORK_OS = "cisco.cdo.cdo"
+
+
+def connection_host(socket_path: str) -> str:
+    """Return the CDO host of the persistent connection at socket_path when it is a cisco.cdo httpapi connection, or
+    None when there is no persistent connection or it belongs to another platform"""
+    if not socket_path:
+        return None
+    connection = Connection(socket_path)
+    try:
+        if connection.get_option("network_os") != NETWORK_OS:
+            return None
+        return connection.get_option("host")
+    except ConnectionError:
+        return None
+
+
+class CDOConnectionSession(requests.Session):
+    """http session of a module running over the cisco.cdo httpapi connection. Requests are prepared here as with any
+    other session, hooks, retries and rate limiting included, and then sent by the connection plugin over the pooled,
+    authenticated session it keeps open in the persistent connection daemon for the whole play.
+
+    The daemon serves its socket one request at a time, so the calls of a module are sent serially whatever the
+    number of workers. Callers check serial and do not start a pool of workers that would only queue on the socket."""
+
+    serial = True
+
+    def __init__(self, socket_path: str):
+        super(CDOConnectionSession, self).__init__()
+        self.connection = Connection(socket_path)
+        # Certificates are validated as the connection is configured (validate_certs) unless a request says otherwise
+        self.verify = None
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        # The daemon adds its own Authorization header, the API key of the task is not sent over the socket
+        headers = {key: value for key, value in request.headers.items() if key.lower() != "authorization"}
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        try:
+            # The body is read whole by the daemon, with stream the content is still available from response.raw
+            reply = self.connection.send_request(
+                request.method,
+                request.url,
+                base64.b64encode(body).decode() if body else None,
+                headers,
+                timeout=kwargs.get("timeout"),
+                verify=kwargs.get("verify"),
+                allow_redirects=kwargs.get("allow_redirects", True),
+            )
+        except ConnectionError as e:
+            # Let the retry policy treat a failure of the daemon like any other connection error
+            raise requests.ConnectionError(str(e), request=request)
+
+        response = requests.Response()
+        response.status_code = reply["status"]
+        response.reason = reply["reason"]
+        response.headers = CaseInsensitiveDict(reply["headers"])
+        # The body was already decoded by the daemon
+        response.headers.pop("Content-Encoding", None)
+        response._content = base64.b64decode(reply["body"])
+        response.headers["Content-Length"] = str(len(response._content))
+        response.raw = io.BytesIO(response._content)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(seconds=reply["elapsed"])
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return dispatch_hook("response", request.hooks, response, **kwargs)
@@ -14,12 +14,34 @@ from Crypto.Cipher import PKCS1_v1_5
 import json
 
 
+# Parsed lar public keys and their PKCS1 ciphers, keyed by keyId and encoded key, so each key is imported once per
+# process
+_public_keys = dict()
+_ciphers = dict()
+
+
 class CDOCrypto:
+    @staticmethod
+    def public_key(lar):
+        """Return the parsed RSA public key of the lar, importing it on first use"""
+        lar_key = lar["larPublicKey"]
+        cache_key = (lar_key["keyId"], lar_key["encodedKey"])
+        if cache_key not in _public_keys:
+            _public_keys[cache_key] = RSA.importKey(base64.b64decode(lar_key["encodedKey"]))
+        return _public_keys[cache_key]
+
+    @staticmethod
+    def cipher(lar):
+        """Return the PKCS1 v1.5 cipher for the lar public key, built on first use"""
+        cache_key = (lar["larPublicKey"]["keyId"], lar["larPublicKey"]["encodedKey"])
+        if cache_key not in _ciphers:
+            _ciphers[cache_key] = PKCS1_v1_5.new(CDOCrypto.public_key(lar))
+        return _ciphers[cache_key]
+
     @staticmethod
     def encrypt_creds(username, password, lar):
         # lar['larPublicKey']['encodedKey']
-        key = RSA.importKey(base64.b64decode(lar["larPublicKey"]["encodedKey"]))
-        encryptor = PKCS1_v1_5.new(key)
+        encryptor = CDOCrypto.cipher(lar)
         enc_creds = json.dumps(
             {
                 "keyId": lar["larPublicKey"]["keyId"],
@@ -29,3 +51,15 @@ class CDOCrypto:
         )
 
         return {"credentials": enc_creds}
+
+    @staticmethod
+    def encrypt_creds_batch(credentials, lar):
+        """Encrypt a list of (username, password) pairs against the same lar, in order, with one cipher. A pair that
+        cannot be encrypted gives the exception raised for it in its place, so that it does not fail the others"""
+        encrypted = list()
+        for username, password in credentials:
+            try:
+                encrypted.append(CDOCrypto.encrypt_creds(username, password, lar))
+            except Exception as e:
+                encrypted.append(e)
+        return encrypted
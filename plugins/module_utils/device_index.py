@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from bisect import bisect_left
+from collections import defaultdict
+from ansible_collections.cisco.cdo.plugins.module_utils.query import DEVICE_TYPES
+
+
+class DeviceIndex:
+    """In-memory indexes over a full inventory fetch so that devices can be resolved by uid, name, ipv4 or serial
+    without further API calls. Names ending in '*' are resolved as a prefix match against a sorted name index."""
+
+    def __init__(self, devices: list):
+        self.by_uid = {}
+        self.by_name = defaultdict(list)
+        self.by_ipv4 = defaultdict(list)
+        self.by_serial = defaultdict(list)
+        for device in devices:
+            self.by_uid[device.get("uid")] = device
+            self.by_name[device.get("name")].append(device)
+            if device.get("serial"):
+                self.by_serial[device.get("serial")].append(device)
+            if device.get("ipv4"):
+                # Index both host:port and the bare host
+                host = device.get("ipv4").rsplit(":", 1)[0]
+                for ipv4 in {device.get("ipv4"), host}:
+                    self.by_ipv4[ipv4].append(device)
+        self.names = sorted(name for name in self.by_name if name)
+
+    def get(self, uid: str) -> dict | None:
+        """Return the device with the given uid"""
+        return self.by_uid.get(uid)
+
+    def by_name_prefix(self, prefix: str) -> list:
+        """Return every device whose name starts with prefix"""
+        devices = []
+        for name in self.names[bisect_left(self.names, prefix):]:
+            if not name.startswith(prefix):
+                break
+            devices.extend(self.by_name[name])
+        return devices
+
+    def lookup(self, filter: str, device_type: str = None) -> list:
+        """Return the devices whose name, ipv4 or serial matches filter, optionally limited to a device_type module
+        choice (asa, ios, ftd, fmc). Nothing matches a missing filter"""
+        if not filter:
+            return []
+        if filter.endswith("*"):
+            matches = self.by_name_prefix(filter[:-1])
+        else:
+            matches = self.by_name.get(filter, []) + self.by_ipv4.get(filter, []) + self.by_serial.get(filter, [])
+        # A device can match on more than one key, keep the first occurrence of each
+        unique = {}
+        for device in matches:
+            unique.setdefault(device.get("uid"), device)
+        matches = list(unique.values())
+        device_types = DEVICE_TYPES.get(device_type)
+        if device_types is not None:
+            matches = [device for device in matches if device.get("deviceType") in device_types]
+        return matches
+
+
+class LARIndex:
+    """In-memory index over the full SDC/CDG (lar) listing of a tenant, keyed by name and ipv4 like the
+    'name:<sdc> OR ipv4:<sdc>' lar query."""
+
+    def __init__(self, lars: list):
+        self.lars = lars
+        self.by_key = defaultdict(list)
+        for lar in lars:
+            keys = {lar.get("name")}
+            if lar.get("ipv4"):
+                # Index both host:port and the bare host
+                keys |= {lar.get("ipv4"), lar.get("ipv4").rsplit(":", 1)[0]}
+            for key in keys - {None}:
+                self.by_key[key].append(lar)
+
+    def lookup(self, sdc: str = None) -> list:
+        """Return the lars whose name or ipv4 is sdc, or every lar when no sdc is given"""
+        if sdc is None:
+            return list(self.lars)
+        return list(self.by_key.get(sdc, []))
@@ -3,13 +3,21 @@
 #
 # Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
 
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 from ansible_collections.cisco.cdo.plugins.module_utils.crypto import CDOCrypto
 from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
 from ansible_collections.cisco.cdo.plugins.module_utils.devices import ASAIOSModel
-from ansible_collections.cisco.cdo.plugins.module_utils.common import get_lar_list, get_specific_device, get_device
+from ansible_collections.cisco.cdo.plugins.module_utils.poller import CDOPoller
+from ansible_collections.cisco.cdo.plugins.module_utils.common import (
+    find_lars,
+    get_specific_device,
+    get_objects_by_uid,
+    update_inventory,
+)
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import (
+    AddDeviceFailure,
+    DeviceNotFound,
     SDCNotFound,
     InvalidCertificate,
     DeviceUnreachable,
@@ -20,10 +28,10 @@ from ansible_collections.cisco.cdo.plugins.module_utils.errors import (
 import requests
 
 
-def connectivity_poll(module_params: dict, http_session: requests.session, endpoint: str, uid: str) -> bool:
-    """Check device connectivity or fail after retry attempts have expired"""
-    for i in range(module_params.get("retry")):
-        device = get_device(http_session, endpoint, uid)
+def connectivity_check(module_params: dict, http_session: requests.session, endpoint: str, uid: str):
+    """Return a poller check that passes once CDO can reach the newly added device"""
+
+    def check(device: dict) -> bool | None:
         if device["connectivityState"] == -2:
             if module_params.get("ignore_cert"):
                 update_device(http_session, endpoint, uid, data={"ignoreCertificate": True})
@@ -31,42 +39,65 @@ def connectivity_poll(module_params: dict, http_session: requests.session, endpo
             else:
                 # TODO: Delete the device we just attempted to add....
                 raise InvalidCertificate(f"{device['connectivityError']}")
-        if device["connectivityState"] > -1 or device["status"] == "WAITING_FOR_DATA":
+        if device["connectivityState"] > -1 or device.get("status") == "WAITING_FOR_DATA":
             return True
-        sleep(module_params.get("delay"))
-    raise DeviceUnreachable(
+
+    return check
+
+
+def connectivity_timeout(module_params: dict):
+    """Return the poller timeout handler for a device CDO never reached"""
+    return lambda device: DeviceUnreachable(
         f"Device {module_params.get('device_name')} was not reachable at "
         f"{module_params.get('ipv4')}:{module_params.get('mgmt_port')} by CDO"
     )
 
 
-def asa_credentails_polling(module_params: dict, http_session: requests.session, endpoint: str, uid: str) -> dict:
-    """Check credentials have been used successfully  or fail after retry attempts have expired"""
-    for i in range(module_params.get("retry")):
-        result = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.ASA_CONFIG.value}/{uid}")
+def asa_credentials_check(module_params: dict):
+    """Return a poller check that passes once the ASA has accepted the credentials"""
+
+    def check(result: dict) -> dict | None:
         if result["state"] == "BAD_CREDENTIALS":
             raise CredentialsFailure(
                 f"Credentials provided for device {module_params.get('device_name')} were rejected."
             )
         elif result["state"] == "PENDING_GET_CONFIG_DONE" or result["state"] == "DONE" or result["state"] == "IDLE":
             return result
-        sleep(module_params.get("delay"))
-    raise APIError(
+
+    return check
+
+
+def asa_credentials_timeout(module_params: dict):
+    """Return the poller timeout handler for an ASA that never reached a known good state"""
+    return lambda result: APIError(
         f"Credentials for device {module_params.get('device_name')} were sent but we never reached a known good state."
     )
 
 
-def ios_credentials_polling(module_params: dict, http_session: requests.session, endpoint: str, uid: str) -> dict:
-    """Check to see if the supplied credentials are accepted by the live device"""
-    for i in range(module_params.get("retry")):
-        device = get_device(http_session, endpoint, uid)
+def ios_credentials_check(module_params: dict):
+    """Return a poller check that passes once the IOS device has accepted the credentials"""
+
+    def check(device: dict) -> dict | None:
         if device["connectivityState"] == -5:
-            sleep(module_params.get("delay"))
+            return None
         elif device["connectivityError"] is not None:
             raise CredentialsFailure(device.get("connectivityError"))
         elif device["connectivityState"] > 0:
             return device
-    raise CredentialsFailure(f"Device remains in connectivity state {device.get('connectivityState')}")
+
+    return check
+
+
+def ios_credentials_timeout(module_params: dict):
+    """Return the poller timeout handler for an IOS device whose credentials were never accepted"""
+    return lambda device: CredentialsFailure(
+        f"Device remains in connectivity state {(device or {}).get('connectivityState')}"
+    )
+
+
+def poll_timeout(module_params: dict) -> float:
+    """The time budget of a polling phase, as expressed by the retry and delay options"""
+    return module_params.get("retry") * module_params.get("delay")
 
 
 def update_device(http_session: requests.session, endpoint: str, uid: str, data: dict):
@@ -74,46 +105,185 @@ def update_device(http_session: requests.session, endpoint: str, uid: str, data:
     return CDORequests.put(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}/{uid}", data=data)
 
 
-def add_asa_ios(module_params: dict, http_session: requests.session, endpoint: str):
-    """Add ASA or IOS device to CDO"""
-
-    lar_list = get_lar_list(module_params, http_session, endpoint)
+def get_lar(module_params: dict, http_session: requests.session, endpoint: str) -> dict:
+    """Return the single SDC/CDG (lar) the device will be onboarded through"""
+    lar_list = find_lars(module_params, http_session, endpoint)
     if len(lar_list) != 1:
         raise (SDCNotFound("Could not find SDC"))
-    else:
-        lar = lar_list[0]
-
-    asa_ios_device = ASAIOSModel(
-        deviceType=module_params.get("device_type").upper(),
-        host=module_params.get("ipv4"),
-        ipv4=f"{module_params.get('ipv4')}:{module_params.get('mgmt_port')}",
-        larType="CDG" if lar["cdg"] else "SDC",
-        larUid=lar["uid"],
-        model=False,
-        name=module_params.get("device_name"),
-    )
+    return lar_list[0]
+
 
-    if module_params.get("ignore_cert"):
-        asa_ios_device.ignore_cert = False
+def onboard_asa_ios(devices: list, http_session: requests.session, endpoint: str, workers: int = 10) -> list:
+    """Onboard ASA or IOS devices to CDO in phases: create the devices, wait for connectivity, send the credentials
+    and wait for them to be accepted. The API calls of a phase run concurrently and each polling phase waits on all
+    devices at once. Return, per device, the onboarded device or the exception that stopped it."""
+    if getattr(http_session, "serial", False):
+        workers = 1
+    results = [None] * len(devices)
+    lars = dict()
+    for sdc in dict.fromkeys(device.get("sdc") for device in devices):
+        try:
+            lars[sdc] = get_lar({"sdc": sdc}, http_session, endpoint)
+        except (SDCNotFound, CredentialsFailure, APIError) as e:
+            lars[sdc] = e
 
-    try:
+    def pending() -> list:
+        return [i for i, result in enumerate(results) if not isinstance(result, Exception)]
+
+    def run_concurrently(fn, indexes: list):
+        def call(i: int):
+            try:
+                results[i] = fn(i)
+            except Exception as e:
+                results[i] = e
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(call, indexes))
+
+    def poll(watches: dict):
+        delay = min(devices[i].get("delay") for i in watches)
+        poller = CDOPoller(http_session, endpoint, delay=delay)
+        for i, (path, uid, check, on_timeout) in watches.items():
+            poller.add(path, uid, check, poll_timeout(devices[i]), on_timeout)
+        try:
+            polled = poller.run()
+        except (DeviceNotFound, CredentialsFailure, APIError) as e:
+            # The devices exist in CDO by now, report them with the error that stopped following their onboarding
+            for i in watches:
+                results[i] = AddDeviceFailure(
+                    f"{devices[i].get('device_name')} was added to CDO with uid {created[i]['uid']} but its "
+                    f"onboarding status could not be read: {getattr(e, 'message', e)}"
+                )
+            return
+        for i, (path, uid, check, on_timeout) in watches.items():
+            results[i] = polled[(path, uid)]
+
+    # Create the devices
+    def create(i: int) -> dict:
+        module_params = devices[i]
+        lar = lars[module_params.get("sdc")]
+        if isinstance(lar, Exception):
+            raise lar
+        if not module_params.get("username") or not module_params.get("password"):
+            raise CredentialsFailure(f"A username and password are required to add {module_params.get('device_name')}")
+        asa_ios_device = ASAIOSModel(
+            deviceType=module_params.get("device_type").upper(),
+            host=module_params.get("ipv4"),
+            ipv4=f"{module_params.get('ipv4')}:{module_params.get('mgmt_port')}",
+            larType="CDG" if lar["cdg"] else "SDC",
+            larUid=lar["uid"],
+            model=False,
+            name=module_params.get("device_name"),
+        )
+        if module_params.get("ignore_cert"):
+            asa_ios_device.ignore_cert = False
         path = CDOAPI.DEVICES.value
-        device = CDORequests.post(http_session, f"https://{endpoint}", path=path, data=asa_ios_device.asdict())
-        connectivity_poll(module_params, http_session, endpoint, device["uid"])
-    except DuplicateObject as e:
-        raise e
-
-    creds_crypto = CDOCrypto.encrypt_creds(module_params.get("username"), module_params.get("password"), lar)
-
-    if module_params.get("device_type").upper() == "ASA":
-        creds_crypto["state"] = "CERT_VALIDATED"
-        specific_device = get_specific_device(http_session, endpoint, device["uid"])
-        path = f"{CDOAPI.ASA_CONFIG.value}/{specific_device['uid']}"
-        CDORequests.put(http_session, f"https://{endpoint}", path=path, data=creds_crypto)
-        asa_credentails_polling(module_params, http_session, endpoint, specific_device["uid"])
-        return get_device(http_session, endpoint, device["uid"])
-    elif module_params.get("device_type").upper() == "IOS":
-        creds_crypto["stateMachineContext"] = {"acceptCert": True}
-        path = f"{CDOAPI.DEVICES.value}/{device['uid']}"
-        CDORequests.put(http_session, f"https://{endpoint}", path=path, data=creds_crypto)
-        return ios_credentials_polling(module_params, http_session, endpoint, device["uid"])
+        return CDORequests.post(http_session, f"https://{endpoint}", path=path, data=asa_ios_device.asdict())
+
+    run_concurrently(create, list(range(len(devices))))
+    created = {i: results[i] for i in pending()}
+    if not created:
+        return results
+    update_inventory(http_session, endpoint, added=list(created.values()))
+
+    # Wait until CDO can reach every new device
+    poll(
+        {
+            i: (
+                CDOAPI.DEVICES.value,
+                device["uid"],
+                connectivity_check(devices[i], http_session, endpoint, device["uid"]),
+                connectivity_timeout(devices[i]),
+            )
+            for i, device in created.items()
+        }
+    )
+
+    # Encrypt the credentials of all devices behind the same lar in one batch, then send them. A device whose
+    # credentials cannot be encrypted fails on its own
+    creds = dict()
+    for sdc in dict.fromkeys(devices[i].get("sdc") for i in pending()):
+        batch = [i for i in pending() if devices[i].get("sdc") == sdc]
+        encrypted = CDOCrypto.encrypt_creds_batch(
+            [(devices[i].get("username"), devices[i].get("password")) for i in batch], lars[sdc]
+        )
+        creds.update(zip(batch, encrypted))
+
+    def send_credentials(i: int) -> dict:
+        module_params, device = devices[i], created[i]
+        creds_crypto = creds[i]
+        if isinstance(creds_crypto, Exception):
+            raise creds_crypto
+        if module_params.get("device_type").upper() == "ASA":
+            creds_crypto["state"] = "CERT_VALIDATED"
+            specific_device = get_specific_device(http_session, endpoint, device["uid"])
+            path = f"{CDOAPI.ASA_CONFIG.value}/{specific_device['uid']}"
+            CDORequests.put(http_session, f"https://{endpoint}", path=path, data=creds_crypto)
+            return specific_device
+        else:
+            creds_crypto["stateMachineContext"] = {"acceptCert": True}
+            path = f"{CDOAPI.DEVICES.value}/{device['uid']}"
+            CDORequests.put(http_session, f"https://{endpoint}", path=path, data=creds_crypto)
+            return device
+
+    run_concurrently(send_credentials, pending())
+    asa = [i for i in pending() if devices[i].get("device_type").upper() == "ASA"]
+    ios = [i for i in pending() if devices[i].get("device_type").upper() == "IOS"]
+    if not asa and not ios:
+        return results
+
+    # Wait until every device has accepted its credentials
+    watches = dict()
+    for i in asa:
+        watches[i] = (
+            CDOAPI.ASA_CONFIG.value,
+            results[i]["uid"],
+            asa_credentials_check(devices[i]),
+            asa_credentials_timeout(devices[i]),
+        )
+    for i in ios:
+        watches[i] = (
+            CDOAPI.DEVICES.value,
+            created[i]["uid"],
+            ios_credentials_check(devices[i]),
+            ios_credentials_timeout(devices[i]),
+        )
+    poll(watches)
+
+    # The IOS polling already returned the device, refresh the onboarded ASAs
+    asa = [i for i in asa if not isinstance(results[i], Exception)]
+    if asa:
+        try:
+            latest = get_objects_by_uid(http_session, endpoint, CDOAPI.DEVICES.value, [created[i]["uid"] for i in asa])
+        except (DeviceNotFound, CredentialsFailure, APIError):
+            # The ASAs are onboarded, fall back to the devices as they were created
+            latest = dict()
+        for i in asa:
+            results[i] = latest.get(created[i]["uid"], created[i])
+    return results
+
+
+def add_asa_ios(module_params: dict, http_session: requests.session, endpoint: str):
+    """Add ASA or IOS device to CDO"""
+    result = onboard_asa_ios([module_params], http_session, endpoint, workers=1)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def add_asa_ios_batch(devices: list, http_session: requests.session, endpoint: str, workers: int = 10) -> list:
+    """Onboard many ASA or IOS devices in one module run over a shared http session, resolving each SDC once.
+    Return a result per device in the order given."""
+    results = list()
+    for module_params, device in zip(devices, onboard_asa_ios(devices, http_session, endpoint, workers)):
+        result = dict(device_name=module_params.get("device_name"), stdout="", stderr="", changed=False, failed=False)
+        if isinstance(device, DuplicateObject):
+            result["stdout"] = f"Device Not added: {device.message}"
+        elif isinstance(device, Exception):
+            result["stderr"] = f"ERROR: {getattr(device, 'message', device)}"
+            result["failed"] = True
+        else:
+            result["stdout"] = device
+            result["changed"] = True
+        results.append(result)
+    return results
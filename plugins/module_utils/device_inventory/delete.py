@@ -10,7 +10,8 @@ __metaclass__ = type
 # fmt: off
 from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
-from ansible_collections.cisco.cdo.plugins.module_utils.common import working_set, get_cdfmc, get_specific_device, gather_inventory
+from ansible_collections.cisco.cdo.plugins.module_utils.common import working_set, get_cdfmc, get_cdfmc_specific_device, find_devices
+from ansible_collections.cisco.cdo.plugins.module_utils.common import update_inventory
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import DeviceNotFound, TooManyMatches
 import requests
 # fmt: on
@@ -19,7 +20,7 @@ import requests
 def find_device_for_deletion(module_params: dict, http_session: requests.session, endpoint: str):
     """Find the object we intend to delete"""
     module_params["filter"] = module_params.get("device_name")
-    device_list = gather_inventory(module_params, http_session, endpoint)
+    device_list = find_devices(module_params, http_session, endpoint)
     if len(device_list) < 1:
         raise DeviceNotFound(f"Cannot delete {module_params.get('device_name')} - device by that name not found")
     elif len(device_list) > 1:
@@ -37,11 +38,12 @@ def delete_device(module_params: dict, http_session: requests.session, endpoint:
             response = CDORequests.delete(
                 http_session, f"https://{endpoint}", path=f"{CDOAPI.DEVICES.value}/{device['uid']}"
             )
+            update_inventory(http_session, endpoint, removed=[device["uid"]])
             return response
 
         elif module_params.get("device_type").upper() == "FTD":
             cdfmc = get_cdfmc(http_session, endpoint)
-            cdfmc_specific_device = get_specific_device(http_session, endpoint, cdfmc["uid"])
+            cdfmc_specific_device = get_cdfmc_specific_device(http_session, endpoint, cdfmc)
             data = {
                 "queueTriggerState": "PENDING_DELETE_FTDC",
                 "stateMachineContext": {"ftdCDeviceIDs": f"{device['uid']}"},
@@ -52,6 +54,7 @@ def delete_device(module_params: dict, http_session: requests.session, endpoint:
                 path=f"{CDOAPI.FMC.value}/{cdfmc_specific_device['uid']}",
                 data=data,
             )
+            update_inventory(http_session, endpoint, removed=[device["uid"]])
             return response
     except DeviceNotFound as e:
         raise e
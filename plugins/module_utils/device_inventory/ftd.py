@@ -10,25 +10,26 @@ __metaclass__ = type
 # fmt: off
 import requests
 import base64
-from time import sleep
 from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
 from ansible_collections.cisco.cdo.plugins.module_utils.devices import FTDModel, FTDMetaData
-from ansible_collections.cisco.cdo.plugins.module_utils.common import inventory_count, get_device, get_cdfmc
-from ansible_collections.cisco.cdo.plugins.module_utils.common import get_cdfmc_access_policy_list, get_specific_device
+from ansible_collections.cisco.cdo.plugins.module_utils.poller import CDOPoller
+from ansible_collections.cisco.cdo.plugins.module_utils.common import find_devices, get_device, get_cdfmc
+from ansible_collections.cisco.cdo.plugins.module_utils.common import update_inventory
+from ansible_collections.cisco.cdo.plugins.module_utils.common import get_cdfmc_access_policy, get_cdfmc_specific_device
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import DeviceNotFound, AddDeviceFailure, DuplicateObject, ObjectNotFound
 
 
 # fmt: on
 def new_ftd_polling(module_params: dict, http_session: requests.session, endpoint: str, uid: str):
     """Check that the new FTD specific device has been created before attempting move to the onboarding step"""
-    for i in range(module_params.get("retry")):
-        try:
-            return get_specific_device(http_session, endpoint, uid)
-        except DeviceNotFound:
-            sleep(module_params.get("delay"))
-            continue
-    raise AddDeviceFailure(f"Failed to add FTD {module_params.get('device_name')}")
+    return CDOPoller(http_session, endpoint, delay=module_params.get("delay")).wait(
+        CDOAPI.SPECIFIC_DEVICE.value,
+        uid,
+        lambda specific_device: specific_device,
+        module_params.get("retry") * module_params.get("delay"),
+        lambda specific_device: AddDeviceFailure(f"Failed to add FTD {module_params.get('device_name')}"),
+    )
 
 
 def update_ftd_device(http_session: requests.session, endpoint: str, uid: str, data: dict):
@@ -38,9 +39,7 @@ def update_ftd_device(http_session: requests.session, endpoint: str, uid: str, d
 
 def add_ftd_ltp(module_params: dict, http_session: requests.session, endpoint: str, ftd_device: FTDModel, fmc_uid: str):
     """Onboard an FTD to cdFMC using LTP (serial number onboarding)"""
-    if not inventory_count(
-        http_session, endpoint, filter=f"serial:{module_params.get('serial')}"
-    ) and not inventory_count(http_session, endpoint, filter=f"name:{module_params.get('serial')}"):
+    if not find_devices({"filter": module_params.get("serial")}, http_session, endpoint):
         ftd_device.larType = "CDG"
         ftd_device.name = module_params.get("device_name")
         ftd_device.serial = module_params.get("serial")
@@ -62,6 +61,7 @@ def add_ftd_ltp(module_params: dict, http_session: requests.session, endpoint: s
         new_ftd_device = CDORequests.post(
             http_session, f"https://{endpoint}", path=CDOAPI.DEVICES.value, data=ftd_device.asdict()
         )
+        update_inventory(http_session, endpoint, added=[new_ftd_device])
         ftd_specific_device = new_ftd_polling(module_params, http_session, endpoint, new_ftd_device["uid"])
         new_ftd_device = get_device(http_session, endpoint, new_ftd_device["uid"])
         CDORequests.put(
@@ -80,13 +80,13 @@ def add_ftd(module_params: dict, http_session: requests.session, endpoint: str):
     """Add an FTD to CDO via CLI or LTP process"""
     try:
         cdfmc = get_cdfmc(http_session, endpoint)
-        cdfmc_specific_device = get_specific_device(http_session, endpoint, cdfmc["uid"])
-        access_policy = get_cdfmc_access_policy_list(
+        cdfmc_specific_device = get_cdfmc_specific_device(http_session, endpoint, cdfmc)
+        access_policy = get_cdfmc_access_policy(
             http_session,
             endpoint,
             cdfmc["host"],
             cdfmc_specific_device["domainUid"],
-            access_list_name=module_params.get("access_control_policy"),
+            module_params.get("access_control_policy"),
         )
     except DeviceNotFound as e:
         raise e
@@ -98,8 +98,8 @@ def add_ftd(module_params: dict, http_session: requests.session, endpoint: str):
         name=module_params.get("device_name"),
         associatedDeviceUid=cdfmc["uid"],
         metadata=FTDMetaData(
-            accessPolicyName=access_policy["items"][0]["name"],
-            accessPolicyUuid=access_policy["items"][0]["id"],
+            accessPolicyName=access_policy["name"],
+            accessPolicyUuid=access_policy["id"],
             license_caps=",".join(module_params.get("license")),
             performanceTier=module_params.get("performance_tier"),
         ),
@@ -111,6 +111,7 @@ def add_ftd(module_params: dict, http_session: requests.session, endpoint: str):
         new_device = CDORequests.post(
             http_session, f"https://{endpoint}", path=CDOAPI.DEVICES.value, data=ftd_device.asdict()
         )
+        update_inventory(http_session, endpoint, added=[new_device])
         specific_ftd_device = new_ftd_polling(module_params, http_session, endpoint, new_device["uid"])
         update_ftd_device(
             http_session, endpoint, specific_ftd_device["uid"], {"queueTriggerState": "INITIATE_FTDC_ONBOARDING"}
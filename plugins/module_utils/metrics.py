@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from time import perf_counter, time
+from urllib.parse import urlparse
+from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
+
+# CDOAPI paths as patterns, longest first, so that a request is reported against the endpoint it was made to
+_ENDPOINTS = [
+    (api.value, re.compile(re.sub(r"\\{\w+\\}", "[^/]+", re.escape(api.value)) + r"(/[^/]+)?"))
+    for api in sorted(CDOAPI, key=lambda api: len(api.value), reverse=True)
+]
+
+
+def endpoint_name(url: str) -> str:
+    """Return the CDOAPI path a request url was made to, with a trailing object uid shown as {uid}"""
+    path = urlparse(url).path.lstrip("/")
+    for name, pattern in _ENDPOINTS:
+        match = pattern.fullmatch(path)
+        if match:
+            return f"{name}/{{uid}}" if match.group(1) else name
+    return path
+
+
+def percentile(values: list, percent: float) -> float | None:
+    """Nearest-rank percentile of the values"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class CDOMetrics:
+    """Records every API call of an http session (verb, endpoint, status, bytes, latency), the calls that were
+    retried, and the time spent sleeping in polling loops, retry backoff and the rate limiter."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time()
+        self.calls = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.bytes = Counter()
+        self.retries = Counter()
+        self.sleeps = Counter()
+
+    def response_hook(self, response, *args, **kwargs):
+        """requests response hook. Unless the response is streamed its body is read here, as requests would do right
+        after the hook, so that the latency includes the download"""
+        start = perf_counter()
+        if kwargs.get("stream"):
+            size = int(response.headers.get("Content-Length") or 0)
+        else:
+            size = len(response.content)
+        latency = response.elapsed.total_seconds() + perf_counter() - start
+        key = f"{response.request.method} {endpoint_name(response.request.url)}"
+        with self.lock:
+            self.calls[key].append(latency)
+            self.statuses[key][response.status_code] += 1
+            self.bytes[key] += size
+        return response
+
+    def retry(self, method: str, url: str, delay: float):
+        """Record an API call that is retried after delay seconds of backoff"""
+        with self.lock:
+            self.retries[f"{method} {endpoint_name(url)}"] += 1
+            self.sleeps["retry"] += delay
+
+    def sleep(self, reason: str, seconds: float):
+        """Record time spent sleeping, e.g. 'poll' or 'rate_limit'"""
+        with self.lock:
+            self.sleeps[reason] += seconds
+
+    def summary(self) -> dict:
+        """Return the request counts, p50/p95 latency per endpoint and the split between network and sleep time"""
+        with self.lock:
+            endpoints = {
+                key: {
+                    "count": len(latencies),
+                    "statuses": {str(status): count for status, count in self.statuses[key].items()},
+                    "retries": self.retries[key],
+                    "bytes": self.bytes[key],
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                    "total_ms": round(sum(latencies) * 1000, 1),
+                }
+                for key, latencies in sorted(self.calls.items())
+            }
+            return {
+                "requests": sum(endpoint["count"] for endpoint in endpoints.values()),
+                "retries": sum(self.retries.values()),
+                "bytes": sum(self.bytes.values()),
+                "elapsed_seconds": round(time() - self.started, 3),
+                "network_seconds": round(sum(sum(latencies) for latencies in self.calls.values()), 3),
+                "sleep_seconds": round(sum(self.sleeps.values()), 3),
+                "sleep_by_reason": {reason: round(seconds, 3) for reason, seconds in self.sleeps.items()},
+                "endpoints": endpoints,
+            }
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from collections import defaultdict
+from time import sleep, time
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
+from ansible_collections.cisco.cdo.plugins.module_utils.common import get_objects_by_uid
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import DeviceNotFound
+from ansible_collections.cisco.cdo.plugins.module_utils.profiling import span
+import requests
+
+
+class CDOPoller:
+    """Wait on many pending device or job state machines from a single loop. Every tick fetches the status of all
+    pending objects with one aggregated query per resource path, hands each status to the check registered for that
+    object, then sleeps. The sleep starts short and backs off to twice the configured delay, so quick transitions are
+    seen early without hammering the API during long ones.
+
+    A check returns None while the object is still pending, any other value once it is done, or raises to fail it.
+    """
+
+    def __init__(self, http_session: requests.session, endpoint: str, delay: float = 1, backoff: float = 1.5):
+        self.http_session = http_session
+        self.endpoint = endpoint
+        self.interval = min(0.5, delay)
+        self.max_interval = max(2 * delay, self.interval)
+        self.backoff = backoff
+        self.watches = dict()
+
+    def add(self, path: str, uid: str, check, timeout: float, on_timeout=None):
+        """Watch the object uid under path. path may contain {uid} for resources that can only be read one object at
+        a time and 404 until they exist (e.g. specific-device). on_timeout is given the last status seen and returns
+        the result (usually an exception) recorded if the object is still pending after timeout seconds."""
+        self.watches[(path, uid)] = dict(check=check, timeout=timeout, on_timeout=on_timeout)
+        return self
+
+    def fetch(self, keys: list) -> dict:
+        """Return {(path, uid): status} for the objects that could be read this tick"""
+        statuses = dict()
+        uids_by_path = defaultdict(list)
+        for path, uid in keys:
+            uids_by_path[path].append(uid)
+        for path, uids in uids_by_path.items():
+            if "{uid}" in path:
+                for uid in uids:
+                    try:
+                        statuses[(path, uid)] = CDORequests.get(
+                            self.http_session, f"https://{self.endpoint}", path=path.replace("{uid}", uid)
+                        )
+                    except DeviceNotFound:
+                        continue
+            else:
+                for uid, status in get_objects_by_uid(self.http_session, self.endpoint, path, uids).items():
+                    statuses[(path, uid)] = status
+        return statuses
+
+    def run(self) -> dict:
+        """Poll until every watched object is done, failed or timed out. Return {(path, uid): result} where a failed
+        object maps to the exception that failed it"""
+        results, last_seen = dict(), dict()
+        pending = dict(self.watches)
+        start, interval = time(), self.interval
+        while pending:
+            with span("poll", pending=len(pending)):
+                statuses = self.fetch(list(pending))
+            for key, watch in list(pending.items()):
+                if key in statuses:
+                    last_seen[key] = statuses[key]
+                    try:
+                        result = watch["check"](statuses[key])
+                    except Exception as e:
+                        result = e
+                    if result is not None:
+                        results[key] = result
+                        del pending[key]
+                        continue
+                if time() - start >= watch["timeout"]:
+                    on_timeout = watch["on_timeout"]
+                    results[key] = on_timeout(last_seen.get(key)) if on_timeout is not None else None
+                    del pending[key]
+            if pending:
+                next_deadline = min(start + watch["timeout"] for watch in pending.values())
+                pause = max(0, min(interval, next_deadline - time()))
+                with span("poll_sleep"):
+                    sleep(pause)
+                if getattr(self.http_session, "metrics", None) is not None:
+                    self.http_session.metrics.sleep("poll", pause)
+                interval = min(interval * self.backoff, self.max_interval)
+        self.watches = dict()
+        return results
+
+    def wait(self, path: str, uid: str, check, timeout: float, on_timeout=None):
+        """Poll a single object and return its result, raising the exception that failed it, if any"""
+        result = self.add(path, uid, check, timeout, on_timeout).run()[(path, uid)]
+        if isinstance(result, Exception):
+            raise result
+        return result
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, strftime
+
+PROFILE_MODES = ["cprofile", "trace"]
+DEFAULT_PROFILE_PATH = "~/.ansible/tmp/cdo-profiles"
+
+# The profile of the running module, if profiling was turned on
+_active = None
+
+
+class CDOProfile:
+    """Profile of one module run. In cprofile mode the main thread runs under cProfile and a pstats file is written.
+    In trace mode named spans (module phases, API calls, polling loops) are recorded from every thread and written
+    as a Chrome trace-event file that chrome://tracing or https://ui.perfetto.dev can open."""
+
+    def __init__(self, mode: str, path: str = None):
+        self.mode = mode
+        self.path = os.path.expanduser(path or DEFAULT_PROFILE_PATH)
+        self.started = perf_counter()
+        self.events = list()
+        self.profiler = None
+        if mode == "cprofile":
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            if self.mode == "trace":
+                self.events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": round((start - self.started) * 1e6),
+                        "dur": round((perf_counter() - start) * 1e6),
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "args": args,
+                    }
+                )
+
+    def write(self, name: str) -> str:
+        """Stop profiling and write the pstats or trace file, returning its path"""
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, f"cdo-{name}-{strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        if self.profiler is not None:
+            self.profiler.disable()
+            filename = f"{filename}.prof"
+            self.profiler.dump_stats(filename)
+        else:
+            filename = f"{filename}.trace.json"
+            with open(filename, "w") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return filename
+
+
+def start(mode: str = None, path: str = None):
+    """Turn profiling on for the rest of the module run, unless it is already on"""
+    global _active
+    if _active is None and mode in PROFILE_MODES:
+        _active = CDOProfile(mode, path)
+
+
+@contextmanager
+def span(name: str, **args):
+    """Record a named phase of the module run when tracing, otherwise do nothing"""
+    if _active is None:
+        yield
+    else:
+        with _active.span(name, **args):
+            yield
+
+
+def profiled(name: str):
+    """Decorate a module main() so that it is profiled when CDO_PROFILE (cprofile or trace) is set in the environment,
+    or when the module turns profiling on with start(). The file is written under CDO_PROFILE_PATH (default
+    ~/.ansible/tmp/cdo-profiles) when main() returns or exits."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def new_func(*args, **kwargs):
+            global _active
+            start(os.environ.get("CDO_PROFILE"), os.environ.get("CDO_PROFILE_PATH"))
+            try:
+                with span(name):
+                    return fn(*args, **kwargs)
+            finally:
+                if _active is not None:
+                    _active.write(name)
+                    _active = None
+
+        return new_func
+
+    return decorate
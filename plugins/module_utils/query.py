@@ -9,6 +9,34 @@ __metaclass__ = type
 
 import urllib.parse
 
+# Device fields resolved by an inventory query, by preset
+INVENTORY_FIELDS = {
+    "minimal": ["uid", "name", "ipv4", "deviceType", "state"],
+    "full": [
+        "name", "customLinks", "healthStatus", "sseDeviceRegistrationToken", "sseDeviceSerialNumberRegistration",
+        "sseEnabled", "sseDeviceData", "state", "ignoreCertificate", "deviceType", "configState",
+        "configProcessingState", "model", "ipv4", "modelNumber", "serial", "chassisSerial", "hasFirepower",
+        "connectivityState", "connectivityError", "certificate", "mostRecentCertificate", "tags", "tagKeys", "type",
+        "associatedDeviceUid", "oobDetectionState", "enableOobDetection", "deviceActivity", "softwareVersion",
+        "autoAcceptOobEnabled", "oobCheckInterval", "larUid", "larType", "metadata", "fmcApplianceIpv4",
+        "lastDeployTimestamp",
+    ],
+}
+
+# Device fields kept in the inventory cache, enough to resolve a device by name, ipv4 or serial and type
+INDEX_FIELDS = ["uid", "name", "ipv4", "serial", "deviceType"]
+
+# Server side modification timestamp (epoch ms) of a device, used as the high-water mark of incremental syncs
+MODIFIED_FIELD = "lastUpdatedDate"
+
+# CDO deviceType values behind each device_type module choice
+DEVICE_TYPES = {
+    "asa": ["ASA"],
+    "ios": ["IOS"],
+    "ftd": ["FMC_MANAGED_DEVICE", "FTDC"],
+    "fmc": ["FMCE"],
+}
+
 
 class CDOQuery:
     """Helpers for building complex inventory queries"""
@@ -18,14 +46,7 @@ class CDOQuery:
         """Build the inventory query based on what the user is looking for"""
         device_type = module_params.get("device_type")
         filter = module_params.get("filter")
-        r = (
-            "[targets/devices.{name,customLinks,healthStatus,sseDeviceRegistrationToken,"
-            "sseDeviceSerialNumberRegistration,sseEnabled,sseDeviceData,state,ignoreCertificate,deviceType,"
-            "configState,configProcessingState,model,ipv4,modelNumber,serial,chassisSerial,hasFirepower,"
-            "connectivityState,connectivityError,certificate,mostRecentCertificate,tags,tagKeys,type,"
-            "associatedDeviceUid,oobDetectionState,enableOobDetection,deviceActivity,softwareVersion,"
-            "autoAcceptOobEnabled,oobCheckInterval,larUid,larType,metadata,fmcApplianceIpv4,lastDeployTimestamp}]"
-        )
+        r = f"[targets/devices.{{{','.join(CDOQuery.inventory_fields(module_params.get('fields')))}}}]"
 
         # Build q query
         if device_type is None or device_type == "all":
@@ -41,12 +62,22 @@ class CDOQuery:
             q = q.replace(
                 "(model:false)", f"(model:false) AND ((name:{filter}) OR (ipv4:{filter}) OR (serial:{filter}))"
             )
+        if module_params.get("modified_since") is not None:
+            q = f"{q} AND ({MODIFIED_FIELD}:[{module_params.get('modified_since')} TO *])"
         # TODO: add meraki and other types...
         # Build r query
         # if device_type == None or device_type == "meraki" or device_type == "all":
         #    r = r[0:-1] + ",meraki/mxs.{status,state,physicalDevices,boundDevices,network}" + r[-1:]
         return {"q": q, "r": r}
 
+    @staticmethod
+    def inventory_fields(fields: list = None) -> list:
+        """Expand a list of device field names and presets (minimal, full) into the fields to resolve"""
+        expanded = list()
+        for field in fields or ["full"]:
+            expanded.extend(INVENTORY_FIELDS.get(field, [field]))
+        return list(dict.fromkeys(expanded))
+
     @staticmethod
     def get_lar_query(module_params: dict) -> str | None:
         """return a query to retrieve the SDC details"""
@@ -83,10 +114,24 @@ class CDOQuery:
 
     @staticmethod
     def pending_changes_query(module_params: dict, agg: bool = False) -> str:
+        """Build the query for staged changes of a device (device_name) or of every device selected by device_names,
+        tags and device_type"""
         q = (
-            f"device.name:{module_params.get('device_name')} AND device.configState:NOT_SYNCED AND device.model:false"
+            "device.configState:NOT_SYNCED AND device.model:false"
             " AND NOT device.deviceType:FTDC AND NOT device.deviceType:FMC_MANAGED_DEVICE"
         )
+        device_type = module_params.get("device_type")
+        if device_type in DEVICE_TYPES and device_type != "ftd":
+            q = f"{q} AND ({' OR '.join(f'device.deviceType:{t}' for t in DEVICE_TYPES[device_type])})"
+        if module_params.get("tags"):
+            tag_query = " AND ".join(f'device.tags.labels:"{t}"' for t in module_params.get("tags"))
+            q = f"{q} AND ({tag_query})"
+        names = module_params.get("device_names")
+        if module_params.get("device_name"):
+            names = [module_params.get("device_name")]
+        if names:
+            name_query = " OR ".join(f"device.name:{name}" for name in names)
+            q = f"{name_query} AND {q}" if len(names) == 1 else f"({name_query}) AND {q}"
         r = "[targets/device-changelog.{changeLogInstance}]"
         if agg:
             return {"agg": "count", "q": q, "resolve": r}
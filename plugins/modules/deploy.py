@@ -20,25 +20,150 @@ version_added: "1.0.3"
 description: This module is to read inventory (FTD, ASA, IOS devices) on Cisco Defense Orchestrator (CDO).
 options:
     api_key:
+        description:
+            - CDO API key of the tenant.
+            - Required unless the task runs over an C(ansible.netcommon.httpapi) connection with
+              C(ansible_network_os=cisco.cdo.cdo), which holds the API key and keeps the session to CDO open
+              across tasks.
+            - When set, the task opens its own session to CDO even if it runs over that connection.
         type: str
-        required: true
+        required: false
         no_log: true
     region:
+        description: CDO region of the tenant. Ignored over the cisco.cdo httpapi connection, which uses its own host
         type: str
         choices: [us, eu, apj]
         default: us
+    pool_connections:
+        description: Number of per-host connection pools kept by the HTTP session
+        type: int
+        default: 1
+    pool_maxsize:
+        description: Maximum number of keep-alive connections held open to the CDO endpoint
+        type: int
+        default: 10
+    pool_block:
+        description: Wait for a free pooled connection instead of opening a throwaway one when the pool is exhausted
+        type: bool
+        default: False
+    retries:
+        description: Times a throttled (429) or failed (5xx) API call is retried with exponential backoff and jitter
+        type: int
+        default: 3
+    retry_budget:
+        description: Maximum number of seconds spent backing off before a single API call is given up on
+        type: int
+        default: 60
+    retry_methods:
+        description: HTTP verbs that are safe to retry. POST is not idempotent and is not retried unless listed
+        type: list
+        elements: str
+        choices: [GET, POST, PUT, DELETE]
+        default: [GET, PUT, DELETE]
+    rate_limit:
+        description: >-
+            Maximum API requests per second for this tenant and region, shared by every fork on the control node.
+            Unset means no client side limit
+        type: float
+    rate_burst:
+        description: Number of requests that may be sent back to back before rate_limit applies. Defaults to rate_limit
+        type: int
+    cache_ttl:
+        description: >-
+            Seconds a locally cached copy of the tenant inventory is trusted before it is revalidated with CDO.
+            Device lookups by name (delete, deploy) are served from the cache, and the devices added or deleted
+            by a task are recorded in it. 0 disables the cache
+        type: int
+        default: 0
+    cache_path:
+        description: SQLite file holding the local inventory cache
+        type: str
+        default: ~/.ansible/tmp/cdo_cache.db
+    lookup_cache_ttl:
+        description: >-
+            Seconds tenant constant lookups (SDCs, the cdFMC, its domain, access policies) are reused across the tasks
+            of a run. 0 disables the lookup cache
+        type: int
+        default: 0
+    cache_refresh:
+        description: Drop the cached inventory and lookups of this tenant before running
+        type: bool
+        default: False
+    metrics:
+        description: >-
+            Return a metrics summary with the module result: API calls, retries and bytes, p50/p95 latency per
+            endpoint, and the time spent on the network (summed over concurrent calls) versus sleeping in polling
+            loops, retry backoff and the rate limiter
+        type: bool
+        default: False
+    profile:
+        description: >-
+            Profile the module run on the controller. cprofile writes a pstats file of the main thread, trace writes
+            a Chrome trace-event file with a span per phase, API call and polling round. The CDO_PROFILE environment
+            variable does the same and also covers argument parsing
+        type: str
+        choices: [cprofile, trace]
+    profile_path:
+        description: Directory the profile is written to. Also set by the CDO_PROFILE_PATH environment variable
+        type: str
+        default: ~/.ansible/tmp/cdo-profiles
     deploy:
         device_type:
             type: str
             required: False
             choices: [asa, ios, ftd, all]
             default: "all"
+    bulk_deploy:
+        description: >-
+            Deploy the pending changes of every device selected by device_names, tags and device_type,
+            batch_size devices per deploy job. The devices whose deploy did not finish within the timeout are
+            returned in timed_out, and the devices of the jobs CDO did not accept in not_submitted. Either fails
+            the task
+        device_type:
+            type: str
+            required: False
+            choices: [asa, ios, all]
+            default: "all"
+        device_names:
+            type: list
+            elements: str
+        tags:
+            type: list
+            elements: str
+        batch_size:
+            description: Number of devices deployed by each job, at least 1
+            type: int
+            default: 50
+        timeout:
+            type: int
+            default: 20
+        interval:
+            type: int
+            default: 2
     pending:
         device_type:
             type: str
             required: False
             choices: [asa, ios, ftd, all]
             default: "all"
+        device_name:
+            type: str
+        limit:
+            description: Maximum number of devices whose pending changes are returned
+            type: int
+            default: 50
+        offset:
+            description: Position in the device changelog to start reading from
+            type: int
+            default: 0
+        page_size:
+            description: Number of devices read from the device changelog per request, until limit is reached
+            type: int
+            default: 50
+        summary:
+            description: Return the change count, the users and the last change date per device instead of the diffs
+            type: bool
+            default: False
 
 author:
     - Aaron Hackney (@aaronhackney)
@@ -49,10 +174,10 @@ EXAMPLES = r""" """
 # fmt: off
 import requests
 import time
-from time import sleep
 from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORegions, CDORequests
 from ansible_collections.cisco.cdo.plugins.module_utils._version import __version__
+from ansible_collections.cisco.cdo.plugins.module_utils.profiling import profiled, span, start as profile
 from ansible_collections.cisco.cdo.plugins.module_utils.args_common import (
     DEPLOY_ARGUMENT_SPEC,
     DEPLOY_MUTUALLY_REQUIRED_ONE_OF,
@@ -60,7 +185,7 @@ from ansible_collections.cisco.cdo.plugins.module_utils.args_common import (
     DEPLOY_REQUIRED_IF
 )
 from ansible_collections.cisco.cdo.plugins.module_utils.query import CDOQuery
-from ansible_collections.cisco.cdo.plugins.module_utils.common import gather_inventory
+from ansible_collections.cisco.cdo.plugins.module_utils.common import iter_pages, DEFAULT_PAGE_SIZE
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import DeviceNotFound, TooManyMatches, APIError, CredentialsFailure
 from ansible.module_utils.basic import AnsibleModule
 # fmt: on
@@ -70,109 +195,252 @@ from ansible.module_utils.basic import AnsibleModule
 
 def poll_deploy_job(http_session: requests.session, endpoint: str, job_uid: str, retry, interval):
     """Poll the doplay job for a successful completion"""
-    while retry > 0:
-        job_status = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.JOBS.value}/{job_uid}")
-        state_uid = job_status.get("objRefs")[0].get("uid")
-        if job_status.get("stateMachinesProgress").get(state_uid).get("progressStatus") == "DONE":
-            return job_status
-        sleep(interval)
-        retry -= 1
+    from ansible_collections.cisco.cdo.plugins.module_utils.poller import CDOPoller
+
+    poller = CDOPoller(http_session, endpoint, delay=interval)
+    return poller.wait(CDOAPI.JOBS.value, job_uid, job_done, retry * interval)
+
+
+def job_done(job_status: dict) -> dict | None:
+    """Poller check that returns the job once the state machines of all its devices are done"""
+    progress = job_status.get("stateMachinesProgress") or {}
+    if all(progress.get(ref.get("uid"), {}).get("progressStatus") == "DONE" for ref in job_status.get("objRefs")):
+        return job_status
+
+
+def job_timeout(device_uids: list):
+    """Poller timeout handler of a deploy job, returning the uid and last progress status of each of its devices whose
+    deploy had not finished"""
+
+    def on_timeout(job_status: dict) -> list:
+        progress = (job_status or {}).get("stateMachinesProgress") or {}
+        return [
+            {"device_uid": uid, "status": progress.get(uid, {}).get("progressStatus")}
+            for uid in device_uids
+            if progress.get(uid, {}).get("progressStatus") != "DONE"
+        ]
+
+    return on_timeout
 
 
 def deploy_changes(module_params: dict, http_session: requests.session, endpoint: str):
     """Given the device name, deploy the pending config changes to the device if there are any"""
 
-    # Check to see if there are any pending changes before deploying unnecessarily
-    q = CDOQuery.pending_changes_query(module_params, agg=True)
-    count = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEPLOY.value}", query=q).get(
-        "aggregationQueryResult"
-    )
-    if not count:
+    # The changelog entries carry the reference of their device, so a single query tells us whether there is anything
+    # to deploy, what it is and which device to deploy it to
+    pending_config = get_pending_deploy(module_params, http_session, endpoint)
+    if not pending_config:
         return
+    device_uids = list(dict.fromkeys(staged_config["device_uid"] for staged_config in pending_config))
+    if len(device_uids) > 1:
+        raise (
+            TooManyMatches(f"{len(device_uids)} matched - {module_params.get('device_name')} not a unique device name")
+        )
 
-    # collect the pending changes before deployment
-    pending_config = get_pending_deploy(module_params, http_session, endpoint)
+    # Submit the job then return the completed job details after polling for deploy completion
+    job = submit_deploy_job(http_session, endpoint, device_uids)
 
-    # Deploy the pending config
-    module_params["filter"] = module_params.get("device_name")
-    device = gather_inventory(module_params, http_session, endpoint)
-    if len(device) == 0:
-        raise (DeviceNotFound(f"Could not find device {module_params.get('device_name')}"))
-    elif len(device) == 0:
-        raise (TooManyMatches(f"{len(device)} matched - {module_params.get('device_name')} not a unique device name"))
+    return {
+        "deploy_job": poll_deploy_job(
+            http_session, endpoint, job.get("uid"), module_params.get("timeout"), module_params.get("interval")
+        ),
+        "changes_deployed": pending_config,
+    }
+
+
+def submit_deploy_job(http_session: requests.session, endpoint: str, device_uids: list) -> dict:
+    """Submit one job deploying the pending changes of all the given devices"""
     payload = {
         "action": "WRITE",
         "overallProgress": "PENDING",
         "triggerState": "PENDING_ORCHESTRATION",
         "schedule": None,
-        "objRefs": [{"uid": device[0].get("uid"), "namespace": "targets", "type": "devices"}],
+        "objRefs": [{"uid": uid, "namespace": "targets", "type": "devices"} for uid in device_uids],
         "jobContext": None,
     }
+    return CDORequests.post(http_session, f"https://{endpoint}", path=f"{CDOAPI.JOBS.value}", data=payload)
 
-    # Submit the job then return the completed job details after polling for deploy completion
-    job = CDORequests.post(http_session, f"https://{endpoint}", path=f"{CDOAPI.JOBS.value}", data=payload)
 
+def bulk_deploy_changes(module_params: dict, http_session: requests.session, endpoint: str):
+    """Deploy the pending changes of every device selected by device_names, tags and device_type. The devices are
+    packed into jobs of batch_size devices and all jobs are polled together. The devices of the jobs that did not
+    finish within the timeout are returned in timed_out, with the job and the last progress status of each. A job
+    that CDO does not accept does not stop the others: its devices are returned in not_submitted with the error"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.poller import CDOPoller
+
+    pending_config = list(iter_pending_deploy(module_params, http_session, endpoint))
+    device_uids = list(dict.fromkeys(staged_config["device_uid"] for staged_config in pending_config))
+    if not device_uids:
+        return
+
+    batch_size = module_params.get("batch_size")
+    batches = [device_uids[start : start + batch_size] for start in range(0, len(device_uids), batch_size)]
+    device_names = {staged_config["device_uid"]: staged_config["device"] for staged_config in pending_config}
+    jobs, not_submitted = list(), list()
+    for batch in batches:
+        try:
+            jobs.append((submit_deploy_job(http_session, endpoint, batch), batch))
+        except (APIError, CredentialsFailure) as e:
+            not_submitted.extend(
+                {"device": device_names.get(uid), "device_uid": uid, "error": e.message} for uid in batch
+            )
+    poller = CDOPoller(http_session, endpoint, delay=module_params.get("interval"))
+    for job, batch in jobs:
+        poller.add(
+            CDOAPI.JOBS.value,
+            job.get("uid"),
+            job_done,
+            module_params.get("timeout") * module_params.get("interval"),
+            job_timeout(batch),
+        )
+    polled = poller.run()
+
+    deploy_jobs, timed_out = list(), list()
+    for job, batch in jobs:
+        result = polled.get((CDOAPI.JOBS.value, job.get("uid")))
+        if isinstance(result, list):
+            timed_out.extend(
+                {"device": device_names.get(device["device_uid"]), "job_uid": job.get("uid")} | device
+                for device in result
+            )
+        else:
+            deploy_jobs.append(result)
     return {
-        "deploy_job": poll_deploy_job(
-            http_session, endpoint, job.get("uid"), module_params.get("timeout"), module_params.get("interval")
-        ),
+        "deploy_jobs": deploy_jobs,
+        "timed_out": timed_out,
+        "not_submitted": not_submitted,
         "changes_deployed": pending_config,
     }
 
 
-def get_pending_deploy(module_params: dict, http_session: requests.session, endpoint: str) -> str:
-    """Given a device name, return the config staged in CDO to be deployed, if any"""
-    pending_change = list()
+def parse_pending_change(item: dict) -> dict:
+    """Return the staged config of one device-changelog entry"""
+    staged_config = dict()
+    staged_config["device_uid"] = item.get("changeLogInstance").get("objectReference").get("uid")
+    staged_config["device"] = item.get("changeLogInstance").get("name")
+    staged_config["diff"] = list()
+    for event in item.get("changeLogInstance").get("events"):
+        event.get("details").pop("_class")
+        staged_config["diff"].append(event.get("details"))
+        staged_config["user"] = event.get("user")
+        staged_config["date"] = (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(event.get("eventDate")) / 1000.0)) + " UTC"
+        )
+        staged_config["action"] = event.get("action")
+    return staged_config
+
+
+def summarize_pending_change(item: dict) -> dict:
+    """Return the number of staged changes of one device-changelog entry, who made them and when, without the diffs"""
+    events = item.get("changeLogInstance").get("events")
+    last_event = max((int(event.get("eventDate")) for event in events), default=None)
+    return {
+        "device_uid": item.get("changeLogInstance").get("objectReference").get("uid"),
+        "device": item.get("changeLogInstance").get("name"),
+        "changes": len(events),
+        "users": sorted({event.get("user") for event in events if event.get("user")}),
+        "date": (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(last_event / 1000.0)) + " UTC" if last_event else None
+        ),
+    }
+
+
+def iter_pending_deploy(module_params: dict, http_session: requests.session, endpoint: str):
+    """Page through the device changelog and yield the staged config (or its summary) one device at a time, up to
+    limit devices when a limit is given"""
     q = CDOQuery.pending_changes_query(module_params)
-    result = CDORequests.get(http_session, f"https://{endpoint}", path=f"{CDOAPI.DEPLOY.value}", query=q)
-    for item in result:
-        staged_config = dict()
-        staged_config["device_uid"] = item.get("changeLogInstance").get("objectReference").get("uid")
-        staged_config["device"] = item.get("changeLogInstance").get("name")
-        staged_config["diff"] = list()
-        for event in item.get("changeLogInstance").get("events"):
-            event.get("details").pop("_class")
-            staged_config["diff"].append(event.get("details"))
-            staged_config["user"] = event.get("user")
-            staged_config["date"] = (
-                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(event.get("eventDate")) / 1000.0)) + " UTC"
-            )
-            staged_config["action"] = event.get("action")
-        pending_change.append(staged_config)
-    return pending_change
+    parse = summarize_pending_change if module_params.get("summary") else parse_pending_change
+    for page in iter_pages(
+        http_session,
+        endpoint,
+        CDOAPI.DEPLOY.value,
+        query={"q": q["q"], "resolve": q["resolve"]},
+        page_size=module_params.get("page_size") or DEFAULT_PAGE_SIZE,
+        max_items=module_params.get("limit"),
+        offset=module_params.get("offset") or 0,
+    ):
+        for item in page:
+            yield parse(item)
+
 
+def get_pending_deploy(module_params: dict, http_session: requests.session, endpoint: str) -> list:
+    """Given a device name, return the config staged in CDO to be deployed, if any"""
+    return list(iter_pending_deploy(module_params, http_session, endpoint))
 
+
+@profiled("deploy")
 def main():
     result = dict(msg="", stdout="", stdout_lines=[], stderr="", stderr_lines=[], rc=0, failed=False, changed=False)
-    module = AnsibleModule(
-        argument_spec=DEPLOY_ARGUMENT_SPEC,
-        required_one_of=[DEPLOY_MUTUALLY_REQUIRED_ONE_OF],
-        mutually_exclusive=DEPLOY_MUTUALLY_EXCLUSIVE,
-        required_if=DEPLOY_REQUIRED_IF,
-    )
+    with span("parse_args"):
+        module = AnsibleModule(
+            argument_spec=DEPLOY_ARGUMENT_SPEC,
+            required_one_of=[DEPLOY_MUTUALLY_REQUIRED_ONE_OF],
+            mutually_exclusive=DEPLOY_MUTUALLY_EXCLUSIVE,
+            required_if=DEPLOY_REQUIRED_IF,
+        )
+    profile(module.params.get("profile"), module.params.get("profile_path"))
+    if module.params.get("bulk_deploy") and module.params.get("bulk_deploy").get("batch_size") < 1:
+        module.fail_json(msg="bulk_deploy batch_size must be at least 1")
+
+    with span("create_session"):
+        endpoint = CDORegions.get_endpoint(module.params.get("region"))
+        socket_path = None
+        if not module.params.get("api_key"):
+            # Without an API key of its own the task goes through the cisco.cdo httpapi connection and its CDO host
+            from ansible_collections.cisco.cdo.plugins.module_utils.connection import connection_host
 
-    endpoint = CDORegions.get_endpoint(module.params.get("region"))
-    http_session = CDORequests.create_session(module.params.get("api_key"), __version__)
+            endpoint, socket_path = connection_host(module._socket_path), module._socket_path
+            if not endpoint:
+                module.fail_json(msg="api_key is required unless the task runs over the cisco.cdo httpapi connection")
+        http_session = CDORequests.create_session(
+            module.params.get("api_key"), __version__, endpoint, module.params, socket_path
+        )
 
     # Deploy pending configuration changes to specific device
     if module.params.get("deploy"):
         try:
-            deploy = deploy_changes(module.params.get("deploy"), http_session, endpoint)
+            with span("deploy"):
+                deploy = deploy_changes(module.params.get("deploy"), http_session, endpoint)
             result["stdout"] = deploy
             if result["stdout"]:
                 result["changed"] = True
         except (DeviceNotFound, TooManyMatches, APIError, CredentialsFailure) as e:
             result["stderr"] = f"ERROR: {e.message}"
 
+    # Deploy pending configuration changes to every selected device
+    if module.params.get("bulk_deploy"):
+        try:
+            with span("bulk_deploy"):
+                deploy = bulk_deploy_changes(module.params.get("bulk_deploy"), http_session, endpoint)
+            result["stdout"] = deploy
+            if deploy:
+                result["changed"] = bool(deploy["deploy_jobs"] or deploy["timed_out"])
+                errors = list()
+                if deploy["timed_out"]:
+                    devices = ", ".join(device["device"] or device["device_uid"] for device in deploy["timed_out"])
+                    errors.append(f"The deploy to {devices} did not finish in time")
+                if deploy["not_submitted"]:
+                    devices = ", ".join(device["device"] or device["device_uid"] for device in deploy["not_submitted"])
+                    errors.append(f"The deploy to {devices} was not accepted by CDO")
+                if errors:
+                    result["stderr"] = f"ERROR: {'. '.join(errors)}"
+                    result["failed"] = True
+        except (APIError, CredentialsFailure) as e:
+            result["stderr"] = f"ERROR: {e.message}"
+
     # Get pending changes for devices
     if module.params.get("pending"):
         try:
-            pending_deploy = get_pending_deploy(module.params.get("pending"), http_session, endpoint)
+            with span("pending"):
+                pending_deploy = get_pending_deploy(module.params.get("pending"), http_session, endpoint)
             result["stdout"] = pending_deploy
         except (DeviceNotFound, APIError, CredentialsFailure) as e:
             result["stderr"] = f"ERROR: {e.message}"
 
-    module.exit_json(**result)
+    if getattr(http_session, "metrics", None) is not None:
+        result["metrics"] = http_session.metrics.summary()
+    with span("exit_json"):
+        module.exit_json(**result)
 
 
 if __name__ == "__main__":
@@ -19,13 +19,135 @@ version_added: "1.0.0"
 description: This module is to read inventory (FTD, ASA, IOS devices) on Cisco Defense Orchestrator (CDO).
 options:
     api_key:
+        description:
+            - CDO API key of the tenant.
+            - Required unless the task runs over an C(ansible.netcommon.httpapi) connection with
+              C(ansible_network_os=cisco.cdo.cdo), which holds the API key and keeps the session to CDO open
+              across tasks.
+            - When set, the task opens its own session to CDO even if it runs over that connection.
         type: str
-        required: true
+        required: false
         no_log: true
     region:
+        description: CDO region of the tenant. Ignored over the cisco.cdo httpapi connection, which uses its own host
         type: str
         choices: [us, eu, apj]
         default: us
+    pool_connections:
+        description: Number of per-host connection pools kept by the HTTP session
+        type: int
+        default: 1
+    pool_maxsize:
+        description: Maximum number of keep-alive connections held open to the CDO endpoint
+        type: int
+        default: 10
+    pool_block:
+        description: Wait for a free pooled connection instead of opening a throwaway one when the pool is exhausted
+        type: bool
+        default: False
+    retries:
+        description: Times a throttled (429) or failed (5xx) API call is retried with exponential backoff and jitter
+        type: int
+        default: 3
+    retry_budget:
+        description: Maximum number of seconds spent backing off before a single API call is given up on
+        type: int
+        default: 60
+    retry_methods:
+        description: HTTP verbs that are safe to retry. POST is not idempotent and is not retried unless listed
+        type: list
+        elements: str
+        choices: [GET, POST, PUT, DELETE]
+        default: [GET, PUT, DELETE]
+    rate_limit:
+        description: >-
+            Maximum API requests per second for this tenant and region, shared by every fork on the control node.
+            Unset means no client side limit
+        type: float
+    rate_burst:
+        description: Number of requests that may be sent back to back before rate_limit applies. Defaults to rate_limit
+        type: int
+    cache_ttl:
+        description: >-
+            Seconds a locally cached copy of the tenant inventory is trusted before it is revalidated with CDO.
+            Device lookups by name (delete, deploy) are served from the cache, and the devices added or deleted
+            by a task are recorded in it. 0 disables the cache
+        type: int
+        default: 0
+    cache_path:
+        description: SQLite file holding the local inventory cache
+        type: str
+        default: ~/.ansible/tmp/cdo_cache.db
+    lookup_cache_ttl:
+        description: >-
+            Seconds tenant constant lookups (SDCs, the cdFMC, its domain, access policies) are reused across the tasks
+            of a run. 0 disables the lookup cache
+        type: int
+        default: 0
+    cache_refresh:
+        description: Drop the cached inventory and lookups of this tenant before running
+        type: bool
+        default: False
+    metrics:
+        description: >-
+            Return a metrics summary with the module result: API calls, retries and bytes, p50/p95 latency per
+            endpoint, and the time spent on the network (summed over concurrent calls) versus sleeping in polling
+            loops, retry backoff and the rate limiter
+        type: bool
+        default: False
+    profile:
+        description: >-
+            Profile the module run on the controller. cprofile writes a pstats file of the main thread, trace writes
+            a Chrome trace-event file with a span per phase, API call and polling round. The CDO_PROFILE environment
+            variable does the same and also covers argument parsing
+        type: str
+        choices: [cprofile, trace]
+    profile_path:
+        description: Directory the profile is written to. Also set by the CDO_PROFILE_PATH environment variable
+        type: str
+        default: ~/.ansible/tmp/cdo-profiles
+    gather:
+        filter:
+            type: str
+        device_type:
+            type: str
+            choices: [all, asa, ios, ftd, fmc]
+            default: all
+        page_size:
+            description: Number of devices requested from CDO per page while walking the inventory
+            type: int
+            default: 50
+        max_items:
+            description: Stop gathering once this many devices have been returned
+            type: int
+        workers:
+            description: >-
+                Number of inventory pages fetched in parallel once the device count is known.
+                1 walks the pages sequentially, as does the cisco.cdo httpapi connection
+            type: int
+            default: 4
+        fields:
+            description: >-
+                Device fields returned by gather. Entries are field names or the presets minimal
+                (uid, name, ipv4, deviceType, state) and full (every field, including certificates)
+            type: list
+            elements: str
+            default: [full]
+        incremental:
+            description: >-
+                Keep a local snapshot of the gathered inventory (in cache_path) and only download the devices
+                modified since the last run, dropping the devices that were deleted from CDO. Cannot be used with
+                max_items
+            type: bool
+            default: False
+        stream:
+            description: >-
+                Parse each page of devices as it is downloaded instead of buffering and decoding it whole (uses ijson
+                when installed). Pages are then read one after the other and workers is ignored. The gathered
+                devices are still returned as one list in the module result, so this only lowers the cost of
+                decoding the pages, not the memory used by the result
+            type: bool
+            default: False
     add:
         ftd:
             device_name:
@@ -55,6 +177,7 @@ options:
                 type: int
                 default: 1
             serial:
+                description: Serial number of the FTD. Required when onboard_method is ltp
                 type: str
             password:
                 type: str
@@ -86,6 +209,18 @@ options:
             delay:
                 type: int
                 default: 1
+        devices:
+            description: >-
+                Onboard many ASA or IOS devices in a single task. Each element takes the same options as asa_ios.
+                A result is returned per device
+            type: list
+            elements: dict
+        workers:
+            description: >-
+                Number of devices from the devices list onboarded concurrently. Over the cisco.cdo httpapi
+                connection the devices are onboarded one API call at a time
+            type: int
+            default: 10
     delete:
         device_name:
             type: str
@@ -183,6 +318,30 @@ EXAMPLES = r"""
       ansible.builtin.debug:
         msg: "{{ added_device }}"
 
+---
+- name: Add all ASA and IOS devices in the ansible inventory to CDO in one task
+  hosts: localhost
+  tasks:
+    - name: Add ASA and IOS devices to CDO
+      cisco.cdo.device_inventory:
+        api_key: "{{ lookup('ansible.builtin.env', 'CDO_API_KEY') }}"
+        region: "{{ lookup('ansible.builtin.env', 'CDO_REGION') }}"
+        add:
+          workers: 20
+          devices: "{{ batch }}"
+      vars:
+        batch: >-
+          {%- set devices = [] -%}
+          {%- for host in groups['all'] if hostvars[host].device_type in ['asa', 'ios'] -%}
+          {%- set _ = devices.append({'device_name': host, 'sdc': hostvars[host].sdc, 'ipv4': hostvars[host].ipv4,
+          'mgmt_port': hostvars[host].mgmt_port, 'device_type': hostvars[host].device_type,
+          'username': hostvars[host].username, 'password': hostvars[host].password,
+          'ignore_cert': hostvars[host].ignore_cert}) -%}
+          {%- endfor -%}
+          {{ devices }}
+      register: added_devices
+      failed_when: (added_devices.stderr is defined) and (added_devices.stderr | length > 0)
+
 ---
 - name: Delete devices from CDO inventory
   hosts: all
@@ -207,10 +366,8 @@ EXAMPLES = r"""
 # fmt: off
 from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORegions, CDORequests
 from ansible_collections.cisco.cdo.plugins.module_utils._version import __version__
+from ansible_collections.cisco.cdo.plugins.module_utils.profiling import profiled, span, start as profile
 from ansible_collections.cisco.cdo.plugins.module_utils.common import gather_inventory
-from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.ftd import add_ftd
-from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import add_asa_ios
-from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.delete import delete_device
 from ansible_collections.cisco.cdo.plugins.module_utils.errors import (
     DeviceNotFound,
     AddDeviceFailure,
@@ -233,30 +390,52 @@ from ansible.module_utils.basic import AnsibleModule
 # fmt: on
 
 
+@profiled("device_inventory")
 def main():
     result = dict(msg="", stdout="", stdout_lines=[], stderr="", stderr_lines=[], rc=0, failed=False, changed=False)
-    module = AnsibleModule(
-        argument_spec=INVENTORY_ARGUMENT_SPEC,
-        required_one_of=[INVENTORY_REQUIRED_ONE_OF],
-        mutually_exclusive=INVENTORY_MUTUALLY_EXCLUSIVE,
-        required_if=INVENTORY_REQUIRED_IF,
-    )
-    endpoint = CDORegions.get_endpoint(module.params.get("region"))
-    http_session = CDORequests.create_session(module.params.get("api_key"), __version__)
+    with span("parse_args"):
+        module = AnsibleModule(
+            argument_spec=INVENTORY_ARGUMENT_SPEC,
+            required_one_of=[INVENTORY_REQUIRED_ONE_OF],
+            mutually_exclusive=INVENTORY_MUTUALLY_EXCLUSIVE,
+            required_if=INVENTORY_REQUIRED_IF,
+        )
+    profile(module.params.get("profile"), module.params.get("profile_path"))
+    gather = module.params.get("gather") or {}
+    if gather.get("incremental") and gather.get("max_items") is not None:
+        module.fail_json(msg="gather max_items cannot be used with incremental, the snapshot must hold every device")
+    with span("create_session"):
+        endpoint = CDORegions.get_endpoint(module.params.get("region"))
+        socket_path = None
+        if not module.params.get("api_key"):
+            # Without an API key of its own the task goes through the cisco.cdo httpapi connection and its CDO host
+            from ansible_collections.cisco.cdo.plugins.module_utils.connection import connection_host
+
+            endpoint, socket_path = connection_host(module._socket_path), module._socket_path
+            if not endpoint:
+                module.fail_json(msg="api_key is required unless the task runs over the cisco.cdo httpapi connection")
+        http_session = CDORequests.create_session(
+            module.params.get("api_key"), __version__, endpoint, module.params, socket_path
+        )
 
     # Get inventory from CDO and return a list of dict(s) - Devices and attributes
     if module.params.get("gather"):
         try:
-            result["stdout"] = gather_inventory(module.params.get("gather"), http_session, endpoint)
+            with span("gather"):
+                result["stdout"] = gather_inventory(module.params.get("gather"), http_session, endpoint)
             result["changed"] = False
         except (CredentialsFailure, APIError) as e:
             result["stderr"] = f"ERROR: {e.message}"
 
-    # Add devices to CDO inventory and return a json dictionary of the new device attributes
+    # Add devices to CDO inventory and return a json dictionary of the new device attributes. The onboarding code (and
+    # pycryptodome behind it) is only imported by the tasks that use it
     if module.params.get("add"):
         if module.params.get("add", {}).get("ftd"):
+            from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.ftd import add_ftd
+
             try:
-                result["stdout"] = add_ftd(module.params.get("add", {}).get("ftd"), http_session, endpoint)
+                with span("add_ftd"):
+                    result["stdout"] = add_ftd(module.params.get("add", {}).get("ftd"), http_session, endpoint)
                 result["changed"] = True
             except DuplicateObject as e:
                 result["stdout"] = f"Device Not added: {e.message}"
@@ -267,8 +446,12 @@ def main():
                 result["changed"] = False
                 result["failed"] = True
         if module.params.get("add", {}).get("asa_ios"):
+            from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import add_asa_ios
+
             try:
-                result["stdout"] = add_asa_ios(module.params.get("add", {}).get("asa_ios"), http_session, endpoint)
+                with span("add_asa_ios"):
+                    asa_ios = module.params.get("add", {}).get("asa_ios")
+                    result["stdout"] = add_asa_ios(asa_ios, http_session, endpoint)
                 result["changed"] = True
             except DuplicateObject as e:
                 result["stdout"] = f"Device Not added: {e.message}"
@@ -278,16 +461,44 @@ def main():
                 result["stderr"] = f"ERROR: {e.message}"
                 result["changed"] = False
                 result["failed"] = True
+        if module.params.get("add", {}).get("devices"):
+            from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import add_asa_ios_batch
+
+            try:
+                with span("add_devices"):
+                    devices = add_asa_ios_batch(
+                        module.params.get("add", {}).get("devices"),
+                        http_session,
+                        endpoint,
+                        workers=module.params.get("add", {}).get("workers"),
+                    )
+                failed = [device["device_name"] for device in devices if device["failed"]]
+                result["stdout"] = devices
+                result["changed"] = any(device["changed"] for device in devices)
+                if failed:
+                    total = len(devices)
+                    result["stderr"] = f"ERROR: {len(failed)} of {total} devices not onboarded: {', '.join(failed)}"
+                    result["failed"] = True
+            except (SDCNotFound, InvalidCertificate, DeviceUnreachable, CredentialsFailure, APIError) as e:
+                result["stderr"] = f"ERROR: {e.message}"
+                result["changed"] = False
+                result["failed"] = True
 
     # Delete an ASA, FTD, or IOS device from CDO/cdFMC
     if module.params.get("delete"):
+        from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.delete import delete_device
+
         try:
-            result["stdout"] = delete_device(module.params.get("delete"), http_session, endpoint)
+            with span("delete"):
+                result["stdout"] = delete_device(module.params.get("delete"), http_session, endpoint)
             result["changed"] = True
         except (DeviceNotFound, TooManyMatches) as e:
             result["stderr"] = f"ERROR: {e.message}"
 
-    module.exit_json(**result)
+    if getattr(http_session, "metrics", None) is not None:
+        result["metrics"] = http_session.metrics.summary()
+    with span("exit_json"):
+        module.exit_json(**result)
 
 
 if __name__ == "__main__":
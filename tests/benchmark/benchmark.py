@@ -0,0 +1,377 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+# End-to-end benchmarks of the collection against the local stub CDO API (cdo_stub.py). Results are written as JSON
+# and can be compared with an earlier run to catch regressions:
+#
+#   python tests/benchmark/benchmark.py --scale 0.1
+#   python tests/benchmark/benchmark.py --compare tests/benchmark/results/<baseline>.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from cdo_stub import CDOStub, StubConfig, StubServer, lar_public_key, retarget_session
+
+ROOT = Path(__file__).resolve().parents[2]
+SCENARIOS = dict()
+
+
+def import_collection():
+    """Make the checkout importable as ansible_collections.cisco.cdo, wherever it lives"""
+    try:
+        import ansible_collections.cisco.cdo  # noqa: F401
+    except ImportError:
+        if ROOT.parent.name == "cisco" and ROOT.parent.parent.name == "ansible_collections":
+            sys.path.insert(0, str(ROOT.parents[2]))
+        else:
+            collections = Path(tempfile.mkdtemp(prefix="cdo-benchmark-"))
+            (collections / "ansible_collections" / "cisco").mkdir(parents=True)
+            (collections / "ansible_collections" / "cisco" / "cdo").symlink_to(ROOT)
+            sys.path.insert(0, str(collections))
+
+
+def scenario(name: str):
+    def register(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+def params(spec: dict, **overrides) -> dict:
+    """Module params for a dict option of an argument spec, with its defaults applied like AnsibleModule does"""
+    values = {name: option.get("default") for name, option in spec.items()}
+    values.update(overrides)
+    return values
+
+
+def session(server: StubServer, args, **options):
+    """A session as the modules create it, pointed at the stub"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
+    from ansible_collections.cisco.cdo.plugins.module_utils.args_common import COMMON_SPEC
+
+    options = params(COMMON_SPEC, rate_limit=args.rate_limit, **options)
+    http_session = CDORequests.create_session("stub-api-key", "benchmark", server.endpoint, options)
+    return retarget_session(http_session, server.endpoint)
+
+
+def session_without_keep_alive(http_session):
+    """Ask for the connection to be closed after every response, so that each request opens (and, against CDO,
+    negotiates TLS on) a new connection"""
+    http_session.headers["Connection"] = "close"
+    return http_session
+
+
+def measure(stub: CDOStub, fn) -> tuple:
+    """Run fn and return (its result, the wall time and the API traffic it caused). A failed run returns None and
+    records the error"""
+    with stub.lock:
+        stub.requests.clear()
+        stub.statuses.clear()
+        stub.connections = 0
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        result = fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {getattr(e, 'message', e)}"
+    seconds = time.perf_counter() - start
+    with stub.lock:
+        metrics = {
+            "seconds": round(seconds, 4),
+            "requests": sum(stub.requests.values()),
+            "connections": stub.connections,
+            "statuses": {str(status): count for status, count in stub.statuses.items()},
+            "endpoints": dict(stub.requests.most_common()),
+        }
+    if error is not None:
+        metrics["error"] = error
+    return result, metrics
+
+
+def new_stub(args, **config) -> CDOStub:
+    config = dict(
+        latency=args.latency,
+        max_page_size=args.max_page_size,
+        throttle_rate=args.throttle_rate,
+        throttle_burst=args.throttle_burst,
+        lar_public_key=lar_public_key(),
+    ) | config
+    return CDOStub(StubConfig(**config))
+
+
+@scenario("gather")
+def gather(args) -> dict:
+    """Gather the full inventory of a large tenant, paged sequentially, on a worker pool and streamed"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.args_common import INVENTORY_ARGUMENT_SPEC
+    from ansible_collections.cisco.cdo.plugins.module_utils.common import gather_inventory
+
+    count = int(10000 * args.scale)
+    stub = new_stub(args)
+    for index in range(count):
+        stub.seed_device(f"asa{index}")
+    results = dict()
+    with StubServer(stub) as server:
+        spec = INVENTORY_ARGUMENT_SPEC["gather"]["options"]
+        for variant, overrides in {
+            "sequential": {"workers": 1},
+            "workers": {"workers": 4},
+            "stream": {"stream": True},
+            "minimal_fields": {"workers": 4, "fields": ["minimal"]},
+        }.items():
+            module_params = params(spec, page_size=args.page_size, **overrides)
+            devices, results[variant] = measure(
+                stub, lambda: gather_inventory(module_params, session(server, args), server.endpoint)
+            )
+            results[variant]["devices"] = len(devices or [])
+    return results
+
+
+@scenario("onboard")
+def onboard(args) -> dict:
+    """Onboard ASAs in one batch behind three SDCs, then FTDs one module run (session) at a time"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.args_common import INVENTORY_ARGUMENT_SPEC
+    from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import add_asa_ios_batch
+    from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.ftd import add_ftd
+
+    stub = new_stub(args)
+    for index in range(3):
+        stub.add_lar(f"SDC{index}", f"10.255.0.{index}")
+    stub.add_cdfmc(policies=60)
+    add_spec = INVENTORY_ARGUMENT_SPEC["add"]["options"]
+    results = dict()
+    with StubServer(stub) as server:
+        asa_devices = [
+            params(
+                add_spec["devices"]["options"],
+                device_name=f"new-asa{index}",
+                ipv4=f"172.16.{index // 256 % 256}.{index % 256}",
+                sdc=f"SDC{index % 3}",
+                username="admin",
+                password="secret",
+                retry=60,
+            )
+            for index in range(int(500 * args.scale))
+        ]
+        onboarded, results["asa_batch"] = measure(
+            stub, lambda: add_asa_ios_batch(asa_devices, session(server, args), server.endpoint, workers=10)
+        )
+        results["asa_batch"]["devices"] = len(onboarded or [])
+        results["asa_batch"]["failed"] = sum(device["failed"] for device in onboarded or [])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            options = {"lookup_cache_ttl": 300, "cache_path": os.path.join(cache_dir, "cdo_cache.db")}
+
+            def add_ftds() -> list:
+                return [
+                    add_ftd(
+                        params(add_spec["ftd"]["options"], device_name=f"new-ftd{index}", retry=60),
+                        session(server, args, **options),
+                        server.endpoint,
+                    )
+                    for index in range(int(100 * args.scale))
+                ]
+
+            ftds, results["ftd"] = measure(stub, add_ftds)
+            results["ftd"]["devices"] = len(ftds or [])
+    return results
+
+
+@scenario("deploy")
+def deploy(args) -> dict:
+    """Deploy the pending changes of a large tenant with bulk_deploy"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.args_common import DEPLOY_ARGUMENT_SPEC
+    from ansible_collections.cisco.cdo.plugins.modules.deploy import bulk_deploy_changes
+
+    stub = new_stub(args)
+    for index in range(int(1000 * args.scale)):
+        stub.seed_pending_change(stub.seed_device(f"asa{index}"), events=3)
+    with StubServer(stub) as server:
+        module_params = params(DEPLOY_ARGUMENT_SPEC["bulk_deploy"]["options"], batch_size=50)
+        deployed, result = measure(
+            stub, lambda: bulk_deploy_changes(module_params, session(server, args), server.endpoint)
+        )
+    deployed = deployed or {"deploy_jobs": [], "changes_deployed": []}
+    result["jobs"] = len(deployed["deploy_jobs"])
+    result["devices"] = len({change["device_uid"] for change in deployed["changes_deployed"]})
+    return {"bulk_deploy": result}
+
+
+@scenario("connections")
+def connections(args) -> dict:
+    """Count the TCP (and, against CDO, TLS) connections a concurrent gather opens with different pool sizes, against
+    a baseline that opens a fresh connection for every request like the sessions did before connection pooling"""
+    from ansible_collections.cisco.cdo.plugins.module_utils.args_common import INVENTORY_ARGUMENT_SPEC
+    from ansible_collections.cisco.cdo.plugins.module_utils.common import gather_inventory
+
+    stub = new_stub(args, latency=max(args.latency, 0.005))
+    for index in range(int(2000 * args.scale)):
+        stub.seed_device(f"asa{index}")
+    results = dict()
+    with StubServer(stub) as server:
+        module_params = params(INVENTORY_ARGUMENT_SPEC["gather"]["options"], page_size=args.page_size, workers=8)
+        for variant, options in {
+            "no_keepalive": {"keep_alive": False},
+            "pool_maxsize_1": {"pool_maxsize": 1},
+            "pool_maxsize_10": {"pool_maxsize": 10},
+            "pool_maxsize_4_block": {"pool_maxsize": 4, "pool_block": True},
+        }.items():
+            def run() -> list:
+                http_session = session(server, args, **{k: v for k, v in options.items() if k != "keep_alive"})
+                if not options.get("keep_alive", True):
+                    session_without_keep_alive(http_session)
+                return gather_inventory(module_params, http_session, server.endpoint)
+
+            devices, results[variant] = measure(stub, run)
+            results[variant]["devices"] = len(devices or [])
+    return results
+
+
+@scenario("crypto")
+def crypto(args) -> dict:
+    """Per-device cost of encrypting onboarding credentials: importing the lar key on every call (the original
+    implementation), the cipher cached per lar key, and the batch API"""
+    import base64
+    from Crypto.Cipher import PKCS1_v1_5
+    from Crypto.PublicKey import RSA
+    from ansible_collections.cisco.cdo.plugins.module_utils.crypto import CDOCrypto
+
+    lar = {"larPublicKey": lar_public_key()}
+    credentials = [(f"admin{index}", f"secret{index}") for index in range(int(500 * args.scale))]
+
+    def import_per_call():
+        for username, password in credentials:
+            encryptor = PKCS1_v1_5.new(RSA.importKey(base64.b64decode(lar["larPublicKey"]["encodedKey"])))
+            encryptor.encrypt(username.encode())
+            encryptor.encrypt(password.encode())
+
+    results = dict()
+    for variant, fn in {
+        "import_per_call": import_per_call,
+        "cached_cipher": lambda: [CDOCrypto.encrypt_creds(user, password, lar) for user, password in credentials],
+        "batch": lambda: CDOCrypto.encrypt_creds_batch(credentials, lar),
+    }.items():
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        results[variant] = {
+            "seconds": round(seconds, 4),
+            "per_device_us": round(seconds / max(len(credentials), 1) * 1e6, 1),
+            "devices": len(credentials),
+        }
+    return results
+
+
+@scenario("importtime")
+def importtime(args) -> dict:
+    """Start-up cost of the modules: the cumulative python -X importtime of each module (median of several fresh
+    interpreters), and whether the onboarding dependencies were imported for a read-only task"""
+    python_path = os.pathsep.join(path for path in sys.path if path)
+    results = dict()
+    for module in ("device_inventory", "deploy"):
+        name = f"ansible_collections.cisco.cdo.plugins.modules.{module}"
+        runs = list()
+        for run in range(5):
+            imported = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {name}"],
+                env=dict(os.environ, PYTHONPATH=python_path),
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stderr
+            # Lines are "import time: self [us] | cumulative | imported package"
+            lines = [line.split("|") for line in imported.splitlines() if line.startswith("import time:")]
+            modules = {line[2].strip(): int(line[1]) for line in lines[1:]}
+            runs.append(modules)
+        seconds = sorted(modules[name] for modules in runs)[len(runs) // 2] / 1e6
+        results[module] = {
+            "seconds": round(seconds, 4),
+            "modules": len(runs[-1]),
+            "crypto_imported": "Crypto.PublicKey.RSA" in runs[-1],
+            "sqlite3_imported": "sqlite3" in runs[-1],
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return the scenario variants that got slower than the baseline by more than tolerance"""
+    regressions = list()
+    for name, variants in results.items():
+        for variant, result in variants.items():
+            before = baseline.get("results", {}).get(name, {}).get(variant)
+            if not before or not before.get("seconds") or "error" in before or "error" in result:
+                continue
+            ratio = result["seconds"] / before["seconds"]
+            print(f"{name}/{variant}: {before['seconds']:.3f}s -> {result['seconds']:.3f}s ({ratio:.2f}x)")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{name}/{variant}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cisco.cdo collection against a stub CDO API")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the device counts of every scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stub waits before each response")
+    parser.add_argument("--page-size", type=int, default=50, help="page_size used by the gather scenarios")
+    parser.add_argument("--max-page-size", type=int, help="Largest page the stub returns")
+    parser.add_argument("--throttle-rate", type=float, help="Requests per second the stub accepts before a 429")
+    parser.add_argument("--throttle-burst", type=int, help="Requests the stub accepts back to back")
+    parser.add_argument("--rate-limit", type=float, help="Client side rate_limit option of the sessions")
+    parser.add_argument("--output", help="Results file (default tests/benchmark/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against --compare")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    import_collection()
+    results = dict()
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name}...", flush=True)
+        results[name] = SCENARIOS[name](args)
+        for variant, result in results[name].items():
+            print(f"  {variant}: {json.dumps({k: v for k, v in result.items() if k != 'endpoints'})}", flush=True)
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    output = Path(args.output or ROOT / "tests" / "benchmark" / "results" / time.strftime("%Y%m%d-%H%M%S.json"))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "revision": revision,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print(f"Slower than {args.compare}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+# A local stand-in for the parts of the CDO REST API the collection uses (see api_endpoints.CDOAPI), for measuring
+# the collection without a live tenant. Standard library only. The stub speaks plain HTTP, point a session at it
+# with retarget_session().
+
+import base64
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SVCS = "/aegis/rest/v1/services"
+DOMAIN_UID = "e276abec-e0f2-11e3-8169-6d9ed49b625f"
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stub API. Timings are in seconds from the moment the triggering call was made."""
+
+    latency: float = 0.0
+    max_page_size: int = None
+    throttle_rate: float = None
+    throttle_burst: int = None
+    connect_after: float = 0.2
+    credentials_after: float = 0.2
+    register_after: float = 0.2
+    deploy_after: float = 0.5
+    policy_page_size: int = 25
+    lar_public_key: dict = field(default_factory=dict)
+
+
+class Query:
+    """Evaluate the Lucene-like q parameter of CDO list calls: field:value terms combined with AND, OR, NOT and
+    parentheses. Values may be quoted, end in a '*' wildcard, or be a [low TO high] range. Dotted fields walk into
+    nested objects and list values match when any element matches."""
+
+    TOKENS = re.compile(r'\s*(\(|\)|\bAND\b|\bOR\b|\bNOT\b|[\w.]+:(?:"[^"]*"|\[[^\]]*\]|[^\s()]+))')
+
+    def __init__(self, q: str):
+        self.tokens = [token for token in self.TOKENS.findall(q or "") if token]
+        self.position = 0
+        self.tree = self.parse_or() if self.tokens else None
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() not in (None, ")", "OR"):
+            if self.peek() == "AND":
+                self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            return ("not", self.parse_not())
+        if self.peek() == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() == ")":
+                self.take()
+            return node
+        name, value = self.take().split(":", 1)
+        return ("term", name, value.strip('"'))
+
+    def matches(self, obj: dict) -> bool:
+        return self.tree is None or self.evaluate(self.tree, obj)
+
+    def evaluate(self, node, obj: dict) -> bool:
+        if node[0] == "or":
+            return self.evaluate(node[1], obj) or self.evaluate(node[2], obj)
+        if node[0] == "and":
+            return self.evaluate(node[1], obj) and self.evaluate(node[2], obj)
+        if node[0] == "not":
+            return not self.evaluate(node[1], obj)
+        values = [obj]
+        for key in node[1].split("."):
+            nested = []
+            for value in values:
+                item = value.get(key) if isinstance(value, dict) else None
+                nested.extend(item if isinstance(item, list) else [item])
+            values = nested
+        return any(self.term_matches(value, node[2]) for value in values if value is not None)
+
+    @staticmethod
+    def term_matches(value, expected: str) -> bool:
+        if isinstance(value, bool):
+            value = str(value).lower()
+        if expected.startswith("[") and " TO " in expected:
+            low, high = expected[1:-1].split(" TO ")
+            return (low == "*" or int(value) >= int(low)) and (high == "*" or int(value) <= int(high))
+        value = str(value)
+        if expected.endswith("*"):
+            return value.startswith(expected[:-1])
+        return value == expected or value.rsplit(":", 1)[0] == expected
+
+
+class CDOStub:
+    """State of the stub tenant: devices and their specific devices, lars, the cdFMC with its access policies, ASA
+    configs, pending changes and deploy jobs. Device state machines advance with time, as configured."""
+
+    def __init__(self, config: StubConfig = None):
+        self.config = config or StubConfig()
+        self.lock = threading.RLock()
+        self.uids = itertools.count()
+        self.devices = dict()
+        self.asa_configs = dict()
+        self.ftds = dict()
+        self.lars = list()
+        self.access_policies = list()
+        self.jobs = dict()
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.connections = 0
+        self.tokens = float(self.config.throttle_burst or self.config.throttle_rate or 0)
+        self.refilled = time.time()
+
+    def new_uid(self, prefix: str) -> str:
+        return f"{prefix}-{next(self.uids):08d}"
+
+    # Seeding
+    def add_lar(self, name: str, ipv4: str, cdg: bool = False) -> dict:
+        lar = {
+            "uid": self.new_uid("lar"),
+            "name": name,
+            "ipv4": ipv4,
+            "cdg": cdg,
+            "status": "ACTIVE",
+            "larPublicKey": self.config.lar_public_key,
+        }
+        self.lars.append(lar)
+        return lar
+
+    def add_cdfmc(self, policies: int = 3) -> dict:
+        cdfmc = self.seed_device("cdFMC", "FMCE", host="stub-cdfmc.app.us.cdo.cisco.com")
+        self.specific(cdfmc)["domainUid"] = DOMAIN_UID
+        self.access_policies = [{"name": "Default Access Control Policy", "id": self.new_uid("policy")}] + [
+            {"name": f"Policy {index}", "id": self.new_uid("policy")} for index in range(1, policies)
+        ]
+        return cdfmc
+
+    def seed_device(self, name: str, device_type: str = "ASA", **attributes) -> dict:
+        """Add an onboarded, synced device"""
+        index = len(self.devices)
+        device = {
+            "uid": self.new_uid("device"),
+            "name": name,
+            "deviceType": device_type,
+            "model": False,
+            "ipv4": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}:443",
+            "host": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+            "serial": f"SN{index:08d}",
+            "connectivityState": 1,
+            "connectivityError": None,
+            "configState": "SYNCED",
+            "status": "IDLE",
+            "state": "DONE",
+            "tags": {"labels": []},
+            "lastUpdatedDate": int(time.time() * 1000),
+            "_created": 0,
+        }
+        device.update(attributes)
+        with self.lock:
+            self.devices[device["uid"]] = device
+        return device
+
+    def seed_pending_change(self, device: dict, events: int = 1):
+        """Stage config changes on a device so that it shows up in the device changelog"""
+        device["configState"] = "NOT_SYNCED"
+        device["_changes"] = [
+            {
+                "details": {"_class": "com.cisco.lockhart.changelog.ChangeDetails", "diff": f"line {index}"},
+                "user": "stub@example.com",
+                "eventDate": int(time.time() * 1000),
+                "action": "EDIT",
+            }
+            for index in range(events)
+        ]
+
+    def specific(self, device: dict) -> dict:
+        """The specific device (ASA config, FTD or FMC appliance) behind a device"""
+        store = self.asa_configs if device["deviceType"] in ("ASA", "IOS") else self.ftds
+        key = f"specific-{device['uid']}"
+        if key not in store:
+            store[key] = {"uid": key, "deviceUid": device["uid"], "state": "DONE", "_credentials": 0}
+        return store[key]
+
+    # State machines
+    def device_view(self, device: dict) -> dict:
+        now = time.time()
+        created, credentials = device.get("_created", 0), device.get("_credentials", 0)
+        if created and device["deviceType"] in ("ASA", "IOS"):
+            if now < created + self.config.connect_after:
+                device["connectivityState"] = -1
+            elif device["deviceType"] == "ASA":
+                # ASA credentials are sent to the ASA config, the device itself is online once reachable
+                device["connectivityState"] = 1
+            elif not credentials:
+                device["connectivityState"] = 0
+            elif now < credentials + self.config.credentials_after:
+                device["connectivityState"] = -5
+            else:
+                device["connectivityState"] = 1
+        return {key: value for key, value in device.items() if not key.startswith("_")}
+
+    def asa_config_view(self, config: dict) -> dict:
+        credentials = config.get("_credentials", 0)
+        if credentials:
+            ready = time.time() >= credentials + self.config.credentials_after
+            config["state"] = "DONE" if ready else "PENDING_CREDENTIALS"
+        return {key: value for key, value in config.items() if not key.startswith("_")}
+
+    def job_view(self, job: dict) -> dict:
+        done = time.time() >= job["_submitted"] + self.config.deploy_after
+        if done and not job.get("_applied"):
+            for ref in job["objRefs"]:
+                device = self.devices.get(ref["uid"])
+                if device is not None:
+                    device["configState"] = "SYNCED"
+                    device.pop("_changes", None)
+            job["_applied"] = True
+        job["stateMachinesProgress"] = {
+            ref["uid"]: {"progressStatus": "DONE" if done else "IN_PROGRESS"} for ref in job["objRefs"]
+        }
+        job["overallProgress"] = "DONE" if done else "IN_PROGRESS"
+        return {key: value for key, value in job.items() if not key.startswith("_")}
+
+    def changelog_entry(self, device: dict) -> dict:
+        return {
+            "uid": f"changelog-{device['uid']}",
+            "changeLogInstance": {
+                "objectReference": {"uid": device["uid"], "namespace": "targets", "type": "devices"},
+                "name": device["name"],
+                "events": device.get("_changes", []),
+            },
+        }
+
+    # Throttling
+    def throttled(self) -> float | None:
+        """Take a token from the tenant bucket, or return the seconds until one is available"""
+        rate = self.config.throttle_rate
+        if not rate:
+            return None
+        with self.lock:
+            now = time.time()
+            burst = self.config.throttle_burst or rate
+            self.tokens = min(burst, self.tokens + (now - self.refilled) * rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / rate
+
+    # Request routing
+    def handle(self, method: str, path: str, query: dict, body) -> tuple:
+        """Return (status, payload) for an API call"""
+        with self.lock:
+            return self.route(method, path, query, body)
+
+    def route(self, method: str, path: str, query: dict, body) -> tuple:
+        q = Query(query.get("q"))
+        limit, offset = int(query.get("limit") or 50), int(query.get("offset") or 0)
+        if self.config.max_page_size:
+            limit = min(limit, self.config.max_page_size)
+
+        if path == f"{SVCS}/targets/devices":
+            if method == "POST":
+                return self.create_device(body)
+            devices = [device for device in self.devices.values() if q.matches(self.device_view(device))]
+            if query.get("agg") == "count":
+                return 200, {"aggregationQueryResult": len(devices)}
+            return 200, [self.device_view(device) for device in devices[offset : offset + limit]]
+
+        match = re.fullmatch(rf"{SVCS}/targets/devices/([^/]+)", path)
+        if match:
+            device = self.devices.get(match.group(1))
+            if device is None:
+                return 404, {"errorMessage": "Not Found"}
+            if method == "DELETE":
+                del self.devices[device["uid"]]
+                return 204, None
+            if method == "PUT":
+                if "credentials" in (body or {}):
+                    device["_credentials"] = time.time()
+                device.update({key: value for key, value in body.items() if key != "credentials"})
+            return 200, self.device_view(device)
+
+        match = re.fullmatch(r"/aegis/rest/v1/device/([^/]+)/specific-device", path)
+        if match:
+            device = self.devices.get(match.group(1))
+            if device is None or time.time() < device.get("_registered", 0):
+                return 404, {"errorMessage": "Not Found"}
+            return 200, self.asa_config_view(self.specific(device))
+
+        if path == f"{SVCS}/targets/proxies":
+            return 200, [lar for lar in self.lars if q.matches(lar)]
+
+        if path == f"{SVCS}/asa/configs":
+            configs = [self.asa_config_view(config) for config in self.asa_configs.values()]
+            return 200, [config for config in configs if q.matches(config)][offset : offset + limit]
+
+        match = re.fullmatch(rf"{SVCS}/asa/configs/([^/]+)", path)
+        if match:
+            config = self.asa_configs.get(match.group(1))
+            if config is None:
+                return 404, {"errorMessage": "Not Found"}
+            if method == "PUT":
+                config["_credentials"] = time.time()
+            return 200, self.asa_config_view(config)
+
+        match = re.fullmatch(rf"({SVCS}/firepower/ftds|{SVCS}/fmc/appliance)/([^/]+)", path)
+        if match:
+            return 200, {"uid": match.group(2), "queueTriggerState": (body or {}).get("queueTriggerState")}
+
+        if path == f"/fmc/api/fmc_config/v1/domain/{DOMAIN_UID}/policy/accesspolicies":
+            return 200, self.access_policy_page(query)
+
+        if path == f"{SVCS}/targets/device-changelog":
+            entries = [
+                self.changelog_entry(device)
+                for device in self.devices.values()
+                if device["configState"] == "NOT_SYNCED" and q.matches({"device": self.device_view(device)})
+            ]
+            if query.get("agg") == "count":
+                return 200, {"aggregationQueryResult": len(entries)}
+            return 200, entries[offset : offset + limit]
+
+        if path == f"{SVCS}/state-machines/jobs":
+            if method == "POST":
+                job = dict(body, uid=self.new_uid("job"), _submitted=time.time())
+                self.jobs[job["uid"]] = job
+                return 200, self.job_view(job)
+            jobs = [self.job_view(job) for job in self.jobs.values()]
+            return 200, [job for job in jobs if q.matches(job)][offset : offset + limit]
+
+        match = re.fullmatch(rf"{SVCS}/state-machines/jobs/([^/]+)", path)
+        if match:
+            job = self.jobs.get(match.group(1))
+            if job is None:
+                return 404, {"errorMessage": "Not Found"}
+            return 200, self.job_view(job)
+
+        if path == f"{SVCS}/common/workingset":
+            return 200, {"uid": self.new_uid("workingset")}
+
+        return 404, {"errorMessage": f"No stub for {method} {path}"}
+
+    def create_device(self, body: dict) -> tuple:
+        if any(device["name"] == body.get("name") for device in self.devices.values()):
+            return 400, {"errorMessage": f"Duplicate device name {body.get('name')}"}
+        device = self.seed_device(body.get("name"), body.get("deviceType") or "ASA", _created=time.time())
+        device.update({key: value for key, value in body.items() if key in ("ipv4", "host", "larUid", "serial")})
+        device["configState"] = "NOT_SYNCED" if device["deviceType"] in ("ASA", "IOS") else "SYNCED"
+        if device["deviceType"] in ("FTDC", "FMC_MANAGED_DEVICE"):
+            device["_registered"] = time.time() + self.config.register_after
+        elif device["deviceType"] == "ASA":
+            self.specific(device)["state"] = "PRE_CREDENTIALS"
+        return 200, self.device_view(device)
+
+    def access_policy_page(self, query: dict) -> dict:
+        if query.get("name"):
+            items = [policy for policy in self.access_policies if policy["name"] == query.get("name")]
+            return {"items": items, "paging": {"count": len(items), "offset": 0, "limit": len(items), "pages": 1}}
+        limit = min(int(query.get("limit") or 25), self.config.policy_page_size)
+        offset = int(query.get("offset") or 0)
+        paging = {"count": len(self.access_policies), "offset": offset, "limit": limit}
+        if offset + limit < len(self.access_policies):
+            paging["next"] = [f"?offset={offset + limit}&limit={limit}"]
+        return {"items": self.access_policies[offset : offset + limit], "paging": paging}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def dispatch(self, method: str):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if stub.config.latency:
+            time.sleep(stub.config.latency)
+        template = re.sub(r"/(device|lar|job|policy|specific|workingset)-[^/]+", r"/{uid}", url.path)
+        wait = stub.throttled()
+        if wait is not None:
+            status, payload = 429, {"errorMessage": "Too Many Requests"}
+            headers = {"Retry-After": f"{wait:.3f}"}
+        else:
+            status, payload = stub.handle(method, url.path, query, body)
+            headers = {}
+        with stub.lock:
+            stub.requests[f"{method} {template}"] += 1
+            stub.statuses[status] += 1
+        content = json.dumps(payload).encode() if payload is not None else b""
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if method == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+            status, content = 304, b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if method == "GET" and status in (200, 304):
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Serve a CDOStub on 127.0.0.1 from a background thread. Use as a context manager."""
+
+    daemon_threads = True
+
+    def __init__(self, stub: CDOStub = None, port: int = 0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.stub = stub or CDOStub()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def retarget_session(http_session, endpoint: str):
+    """Send the https://{endpoint} calls of a session built by CDORequests.create_session to the plain HTTP stub,
+    through the same pooled adapter"""
+    http_session.mount(f"http://{endpoint}", http_session.get_adapter(f"https://{endpoint}"))
+    request = http_session.request
+
+    def stub_request(method, url, *args, **kwargs):
+        return request(method, url.replace("https://", "http://", 1), *args, **kwargs)
+
+    http_session.request = stub_request
+    return http_session
+
+
+def lar_public_key() -> dict:
+    """A lar public key in the shape CDO returns, with a freshly generated RSA key"""
+    from Crypto.PublicKey import RSA
+
+    key = RSA.generate(2048)
+    return {"keyId": "stub-key", "encodedKey": base64.b64encode(key.publickey().export_key("DER")).decode()}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a stub CDO API on 127.0.0.1 until interrupted")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float)
+    args = parser.parse_args()
+    stub = CDOStub(StubConfig(latency=args.latency, throttle_rate=args.throttle_rate, lar_public_key=lar_public_key()))
+    stub.add_lar("SDC1", "10.255.0.1")
+    stub.add_cdfmc()
+    for index in range(args.devices):
+        stub.seed_device(f"asa{index}")
+    with StubServer(stub, args.port) as server:
+        print(f"Stub CDO API on http://{server.endpoint}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import io
+import json
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import parse_qs, urlsplit
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
+
+ENDPOINT = "cdo.example.com"
+
+
+class FakeCDO(BaseAdapter):
+    """Transport adapter standing in for the CDO API. Every request is recorded and answered by handler(method, path,
+    query, body, headers), which returns a body, or a (status, body) or (status, body, headers) tuple."""
+
+    def __init__(self, handler):
+        super(FakeCDO, self).__init__()
+        self.handler = handler
+        self.requests = list()
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = json.loads(request.body) if request.body else None
+        self.requests.append((request.method, url.path.lstrip("/"), query, body))
+        reply = self.handler(request.method, url.path.lstrip("/"), query, body, request.headers)
+        status, content, headers = (reply + ({},))[:3] if isinstance(reply, tuple) else (200, reply, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content if isinstance(content, bytes) else json.dumps(content).encode()
+        response.raw = io.BytesIO(response._content)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def calls(self, method: str = None, path: str = None) -> list:
+        """The recorded requests, optionally only those with the given method and path"""
+        return [call for call in self.requests if method in (None, call[0]) and path in (None, call[1])]
+
+
+@pytest.fixture
+def endpoint():
+    """The CDO endpoint the sessions of cdo_session are made for"""
+    return ENDPOINT
+
+
+@pytest.fixture
+def cdo_session(tmp_path, monkeypatch):
+    """Return a factory of sessions built by CDORequests.create_session whose calls are answered by a FakeCDO. Retry
+    backoff does not sleep and the caches live in a temporary directory."""
+    monkeypatch.setattr("ansible_collections.cisco.cdo.plugins.module_utils.api_requests.sleep", lambda seconds: None)
+
+    def create(handler, **options):
+        options = {"cache_path": str(tmp_path / "cdo_cache.db")} | options
+        http_session = CDORequests.create_session("api-key", "test", ENDPOINT, options)
+        http_session.fake = FakeCDO(handler)
+        http_session.mount(f"https://{ENDPOINT}", http_session.fake)
+        return http_session
+
+    return create
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import base64
+import re
+import pytest
+from Crypto.PublicKey import RSA
+from ansible_collections.cisco.cdo.plugins.module_utils import poller
+from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
+from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import onboard_asa_ios
+from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.asa import add_asa_ios_batch
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import AddDeviceFailure, CredentialsFailure
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import DuplicateObject, SDCNotFound
+
+
+class Onboarding:
+    """CDO side of ASA and IOS onboarding. Devices named 'bad-creds*' reject their credentials and a device name
+    that is already taken is a duplicate."""
+
+    def __init__(self, lar_public_key: dict):
+        self.lars = [{"uid": "lar1", "name": "SDC-1", "cdg": False, "larPublicKey": lar_public_key}]
+        self.devices = {"0": {"uid": "0", "name": "existing", "connectivityState": 1, "connectivityError": None}}
+        self.configs = dict()
+        # (method, path) of the calls that fail with the status they map to
+        self.failing = dict()
+
+    def device_state(self, uid: str) -> dict:
+        device = self.devices[uid]
+        if device.get("credentials") and device["deviceType"] == "IOS":
+            bad = device["name"].startswith("bad-creds")
+            device |= {"connectivityState": -1 if bad else 1, "connectivityError": "Bad credentials" if bad else None}
+        return device
+
+    def __call__(self, method, path, query, body, headers):
+        if (method, path) in self.failing:
+            return self.failing[(method, path)], {}
+        if method == "GET" and path == CDOAPI.LARS.value:
+            return self.lars
+        if method == "POST" and path == CDOAPI.DEVICES.value:
+            if any(device["name"] == body["name"] for device in self.devices.values()):
+                return 400, {"errorMessage": "Duplicate device name"}
+            uid = str(len(self.devices))
+            self.devices[uid] = body | {"uid": uid, "connectivityState": 1, "connectivityError": None}
+            self.configs[f"config{uid}"] = {"uid": f"config{uid}", "device": uid, "state": "PRE_READ_METADATA"}
+            return self.devices[uid]
+        if method == "GET" and path == CDOAPI.DEVICES.value:
+            return [self.device_state(uid) for uid in re.findall(r"uid:([\w-]+)", query["q"])]
+        match = re.fullmatch(r"aegis/rest/v1/device/(\w+)/specific-device", path)
+        if method == "GET" and match:
+            return {"uid": f"config{match.group(1)}"}
+        if path.startswith(f"{CDOAPI.DEVICES.value}/"):
+            uid = path.rsplit("/", 1)[1]
+            if method == "PUT":
+                self.devices[uid] |= body
+            return self.device_state(uid)
+        if path.startswith(f"{CDOAPI.ASA_CONFIG.value}/"):
+            config = self.configs[path.rsplit("/", 1)[1]]
+            if method == "PUT" and body.get("credentials"):
+                bad = self.devices[config["device"]]["name"].startswith("bad-creds")
+                config["state"] = "BAD_CREDENTIALS" if bad else "DONE"
+            return config
+        if method == "GET" and path == CDOAPI.ASA_CONFIG.value:
+            return [self.configs[uid] for uid in re.findall(r"uid:([\w-]+)", query["q"])]
+        return 404, {}
+
+
+@pytest.fixture(scope="module")
+def lar_public_key() -> dict:
+    key = RSA.generate(1024)
+    return {"keyId": "key1", "encodedKey": base64.b64encode(key.publickey().export_key("DER")).decode()}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(poller, "sleep", lambda seconds: None)
+
+
+def asa(name: str, **params) -> dict:
+    return {
+        "device_name": name,
+        "ipv4": "10.0.0.1",
+        "mgmt_port": 443,
+        "sdc": "SDC-1",
+        "username": "admin",
+        "password": "secret",
+        "ignore_cert": False,
+        "device_type": "asa",
+        "retry": 10,
+        "delay": 1,
+    } | params
+
+
+def test_one_failed_device_does_not_stop_the_others(cdo_session, endpoint, lar_public_key):
+    cdo = Onboarding(lar_public_key)
+    devices = [
+        asa("austin"),
+        asa("no-sdc", sdc="SDC-9"),
+        asa("existing"),
+        asa("bad-creds-asa"),
+        asa("csr", device_type="ios"),
+        asa("bad-creds-csr", device_type="ios"),
+    ]
+    results = onboard_asa_ios(devices, cdo_session(cdo), endpoint, workers=4)
+    assert results[0]["name"] == "austin"
+    assert isinstance(results[1], SDCNotFound)
+    assert isinstance(results[2], DuplicateObject)
+    assert isinstance(results[3], CredentialsFailure)
+    assert results[4]["name"] == "csr"
+    assert isinstance(results[5], CredentialsFailure)
+    # Each device was created once
+    names = sorted(device["name"] for device in cdo.devices.values())
+    assert names == ["austin", "bad-creds-asa", "bad-creds-csr", "csr", "existing"]
+
+
+def test_device_without_credentials_fails_before_it_is_created(cdo_session, endpoint, lar_public_key):
+    cdo = Onboarding(lar_public_key)
+    results = onboard_asa_ios([asa("austin"), asa("no-password", password=None)], cdo_session(cdo), endpoint)
+    assert results[0]["name"] == "austin"
+    assert isinstance(results[1], CredentialsFailure)
+    assert "no-password" not in [device["name"] for device in cdo.devices.values()]
+
+
+def test_rejected_api_key_fails_every_device(cdo_session, endpoint, lar_public_key):
+    cdo = Onboarding(lar_public_key)
+    cdo.failing[("GET", CDOAPI.LARS.value)] = 401
+    results = add_asa_ios_batch([asa("austin"), asa("dallas")], cdo_session(cdo), endpoint)
+    assert [result["failed"] for result in results] == [True, True]
+    assert "API Key was rejected" in results[0]["stderr"]
+    assert list(cdo.devices) == ["0"]
+
+
+def test_failed_polling_reports_the_created_devices(cdo_session, endpoint, lar_public_key):
+    cdo = Onboarding(lar_public_key)
+    cdo.failing[("GET", CDOAPI.DEVICES.value)] = 500
+    results = onboard_asa_ios([asa("austin"), asa("dallas")], cdo_session(cdo), endpoint)
+    assert all(isinstance(result, AddDeviceFailure) for result in results)
+    assert "uid 1" in results[0].message and "uid 2" in results[1].message
+
+
+def test_credentials_that_cannot_be_encrypted_fail_one_device(cdo_session, endpoint, lar_public_key):
+    cdo = Onboarding(lar_public_key)
+    # A 1024 bit key cannot encrypt more than 117 bytes
+    devices = [asa("austin"), asa("long-password", password="x" * 200), asa("csr", device_type="ios")]
+    results = onboard_asa_ios(devices, cdo_session(cdo), endpoint)
+    assert results[0]["name"] == "austin" and results[2]["name"] == "csr"
+    assert isinstance(results[1], ValueError)
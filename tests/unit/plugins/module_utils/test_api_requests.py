@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+import requests
+from email.utils import formatdate
+from time import time
+from ansible_collections.cisco.cdo.plugins.module_utils import api_requests
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORateLimiter, CDORequests, CDORetryPolicy
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import APIError, DeviceNotFound
+
+
+def response(status: int, headers: dict = None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    return result
+
+
+def test_retry_policy_backs_off_exponentially_with_jitter():
+    policy = CDORetryPolicy(retries=5, backoff=0.5, max_backoff=3)
+    for attempt, ceiling in enumerate([0.5, 1, 2, 3, 3]):
+        delay = policy.next_delay("GET", attempt, response(503), 0)
+        assert 0 <= delay <= ceiling
+
+
+def test_retry_policy_honours_retry_after_seconds_and_date():
+    policy = CDORetryPolicy()
+    assert policy.next_delay("GET", 0, response(429, {"Retry-After": "7"}), 0) == 7
+    delay = policy.next_delay("GET", 0, response(429, {"Retry-After": formatdate(time() + 10, usegmt=True)}), 0)
+    assert 8 <= delay <= 10
+
+
+@pytest.mark.parametrize(
+    "method, attempt, status",
+    [
+        ("POST", 0, 503),  # not idempotent
+        ("GET", 3, 503),  # out of retries
+        ("GET", 0, 404),  # not a transient error
+        ("GET", 0, 400),
+    ],
+)
+def test_retry_policy_gives_up(method, attempt, status):
+    assert CDORetryPolicy(retries=3).next_delay(method, attempt, response(status), 0) is None
+
+
+def test_retry_policy_retries_connection_errors():
+    assert CDORetryPolicy().next_delay("GET", 0, None, 0) is not None
+
+
+def test_retry_policy_stops_at_the_budget():
+    policy = CDORetryPolicy(budget=10)
+    assert policy.next_delay("GET", 0, response(429, {"Retry-After": "4"}), 5) == 4
+    assert policy.next_delay("GET", 1, response(429, {"Retry-After": "4"}), 8) is None
+
+
+def test_get_retries_throttled_calls(cdo_session, endpoint):
+    replies = [(429, {}, {"Retry-After": "1"}), (503, {}), [{"uid": "1"}]]
+    http_session = cdo_session(lambda *request: replies.pop(0))
+    assert CDORequests.get(http_session, f"https://{endpoint}", path="devices") == [{"uid": "1"}]
+    assert len(http_session.fake.calls("GET", "devices")) == 3
+
+
+def test_get_raises_once_out_of_retries(cdo_session, endpoint):
+    http_session = cdo_session(lambda *request: (503, {}), retries=2)
+    with pytest.raises(APIError):
+        CDORequests.get(http_session, f"https://{endpoint}", path="devices")
+    assert len(http_session.fake.calls()) == 3
+
+
+def test_post_is_not_retried_by_default(cdo_session, endpoint):
+    http_session = cdo_session(lambda *request: (503, {}))
+    with pytest.raises(APIError):
+        CDORequests.post(http_session, f"https://{endpoint}", path="devices", data={"name": "asa"})
+    assert len(http_session.fake.calls()) == 1
+
+
+def test_not_found_is_not_retried(cdo_session, endpoint):
+    http_session = cdo_session(lambda *request: (404, {}))
+    with pytest.raises(DeviceNotFound):
+        CDORequests.get(http_session, f"https://{endpoint}", path="devices/1")
+    assert len(http_session.fake.calls()) == 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the rate limiter: sleeping advances it instead of waiting"""
+    now = [1000.0]
+    monkeypatch.setattr(api_requests, "time", lambda: now[0])
+    monkeypatch.setattr(api_requests, "sleep", lambda seconds: now.__setitem__(0, now[0] + seconds))
+    return now
+
+
+def test_rate_limiter_allows_a_burst_then_paces(tmp_path, clock):
+    limiter = CDORateLimiter("tenant", rate=2, burst=3, directory=str(tmp_path))
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire() == pytest.approx(0.5)
+    assert limiter.acquire() == pytest.approx(0.5)
+
+
+def test_rate_limiter_refills_over_time(tmp_path, clock):
+    limiter = CDORateLimiter("tenant", rate=1, burst=2, directory=str(tmp_path))
+    limiter.acquire(), limiter.acquire()
+    clock[0] += 10
+    # The bucket never holds more than burst tokens
+    assert [limiter.acquire() for _ in range(2)] == [0, 0]
+    assert limiter.acquire() == pytest.approx(1)
+
+
+def test_rate_limiters_of_a_tenant_share_one_bucket(tmp_path, clock):
+    first = CDORateLimiter("tenant", rate=1, burst=1, directory=str(tmp_path))
+    second = CDORateLimiter("tenant", rate=1, burst=1, directory=str(tmp_path))
+    other_tenant = CDORateLimiter("other", rate=1, burst=1, directory=str(tmp_path))
+    assert first.acquire() == 0
+    assert second.acquire() == pytest.approx(1)
+    assert other_tenant.acquire() == 0
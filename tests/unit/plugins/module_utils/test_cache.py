@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils import cache
+from ansible_collections.cisco.cdo.plugins.module_utils.cache import CDOInventoryCache, CDOLookupCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", lambda: now[0])
+    # Start every test with an empty process wide lookup layer
+    monkeypatch.setattr(cache, "_lookups", dict())
+    return now
+
+
+def test_lookup_cache_expires_after_ttl(tmp_path, clock):
+    lookups = CDOLookupCache(str(tmp_path / "cache.db"), ttl=60)
+    lookups.set("tenant", "cdfmc", {"uid": "1"})
+    assert lookups.get("tenant", "cdfmc") == {"uid": "1"}
+    clock[0] += 61
+    assert lookups.get("tenant", "cdfmc") is None
+
+
+def test_lookup_cache_is_shared_through_sqlite(tmp_path, clock, monkeypatch):
+    CDOLookupCache(str(tmp_path / "cache.db"), ttl=60).set("tenant", "lars", [{"name": "SDC"}])
+    # Another process only sees the SQLite layer
+    monkeypatch.setattr(cache, "_lookups", dict())
+    assert CDOLookupCache(str(tmp_path / "cache.db"), ttl=60).get("tenant", "lars") == [{"name": "SDC"}]
+    assert CDOLookupCache(str(tmp_path / "cache.db"), ttl=60).get("other-tenant", "lars") is None
+
+
+def test_lookup_cache_invalidates_one_key_or_the_tenant(tmp_path, clock, monkeypatch):
+    lookups = CDOLookupCache(str(tmp_path / "cache.db"), ttl=60)
+    for key in ("cdfmc", "lars"):
+        lookups.set("tenant", key, key)
+    lookups.set("other-tenant", "lars", "lars")
+    lookups.invalidate("tenant", "cdfmc")
+    assert lookups.get("tenant", "cdfmc") is None
+    assert lookups.get("tenant", "lars") == "lars"
+    lookups.invalidate("tenant")
+    monkeypatch.setattr(cache, "_lookups", dict())
+    assert lookups.get("tenant", "lars") is None
+    assert lookups.get("other-tenant", "lars") == "lars"
+
+
+def test_inventory_cache_freshness_and_invalidation(tmp_path, clock):
+    inventory = CDOInventoryCache(str(tmp_path / "cache.db"), ttl=300)
+    assert inventory.load("tenant") == (None, [])
+    inventory.store("tenant", [{"offset": 0, "etag": '"a"', "devices": [{"uid": "1"}]}])
+    fetched_at, pages = inventory.load("tenant")
+    assert inventory.is_fresh(fetched_at)
+    assert pages == [{"offset": 0, "etag": '"a"', "devices": [{"uid": "1"}]}]
+    clock[0] += 301
+    assert not inventory.is_fresh(fetched_at)
+    clock[0] -= 301
+    inventory.invalidate("tenant")
+    fetched_at, pages = inventory.load("tenant")
+    # The pages and their etags are kept to revalidate the stale copy
+    assert not inventory.is_fresh(fetched_at)
+    assert pages[0]["etag"] == '"a"'
+
+
+def test_inventory_cache_is_edited_in_place(tmp_path, clock):
+    inventory = CDOInventoryCache(str(tmp_path / "cache.db"), ttl=60)
+    pages = [
+        {"offset": 0, "etag": '"a"', "devices": [{"uid": "1"}, {"uid": "2"}]},
+        {"offset": 2, "etag": '"b"', "devices": [{"uid": "3"}]},
+    ]
+    inventory.store("tenant", pages)
+    clock[0] += 30
+    inventory.update("tenant", added=[{"uid": "4"}], removed=["1"])
+    fetched_at, pages = inventory.load("tenant")
+    # The copy keeps its age, the edited pages lose their ETag
+    assert fetched_at == 1000.0
+    assert pages == [
+        {"offset": 0, "etag": None, "devices": [{"uid": "2"}]},
+        {"offset": 2, "etag": None, "devices": [{"uid": "3"}, {"uid": "4"}]},
+    ]
+    # Nothing is cached for a tenant that was never fetched
+    inventory.update("other", added=[{"uid": "5"}])
+    assert inventory.load("other") == (None, [])
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import hashlib
+import json
+import re
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils import cache
+from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
+from ansible_collections.cisco.cdo.plugins.module_utils.common import cached_inventory, find_devices
+from ansible_collections.cisco.cdo.plugins.module_utils.common import incremental_inventory, iter_items, iter_pages
+from ansible_collections.cisco.cdo.plugins.module_utils.common import get_cdfmc_access_policy
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import ObjectNotFound
+from ansible_collections.cisco.cdo.plugins.module_utils.device_inventory.delete import delete_device
+
+
+class Tenant:
+    """The device collection of a CDO tenant, paged with limit/offset and an ETag per page"""
+
+    def __init__(self, count: int):
+        self.devices = [
+            {"uid": f"uid{index}", "name": f"asa{index}", "ipv4": f"10.0.0.{index}:443", "deviceType": "ASA"}
+            for index in range(count)
+        ]
+        self.statuses = list()
+
+    def __call__(self, method, path, query, body, headers):
+        if method == "GET" and path == CDOAPI.DEVICES.value:
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 50))
+            page = self.devices[offset : offset + limit]
+            etag = f'"{hashlib.sha256(json.dumps(page).encode()).hexdigest()[:8]}"'
+            status = 304 if headers.get("If-None-Match") == etag else 200
+            self.statuses.append(status)
+            return status, b"" if status == 304 else page, {"ETag": etag}
+        if method == "DELETE" and path.startswith(f"{CDOAPI.DEVICES.value}/"):
+            self.devices = [device for device in self.devices if device["uid"] != path.rsplit("/", 1)[1]]
+            return 204, b""
+        if method == "POST" and path == CDOAPI.WORKSET.value:
+            return {}
+        return 404, {}
+
+
+class Collection:
+    """A CDO collection paged with limit/offset that never returns more than max_page_size items a page, and only
+    short[offset] items for the pages starting at the offsets in short"""
+
+    def __init__(self, count: int, max_page_size: int = None, short: dict = None):
+        self.items = [{"uid": f"uid{index}"} for index in range(count)]
+        self.max_page_size = max_page_size
+        self.short = short or {}
+
+    def __call__(self, method, path, query, body, headers):
+        offset, limit = int(query["offset"]), int(query["limit"])
+        if self.max_page_size:
+            limit = min(limit, self.max_page_size)
+        limit = min(limit, self.short.get(offset, limit))
+        return self.items[offset : offset + limit]
+
+
+def walked(http_session, endpoint: str, **kwargs) -> list:
+    return [item["uid"] for page in iter_pages(http_session, endpoint, "items", **kwargs) for item in page]
+
+
+@pytest.fixture(autouse=True)
+def lookups(monkeypatch):
+    monkeypatch.setattr(cache, "_lookups", dict())
+
+
+def test_cached_inventory_is_served_from_cache_while_fresh(cdo_session, endpoint):
+    tenant = Tenant(260)
+    http_session = cdo_session(tenant, cache_ttl=300)
+    assert len(cached_inventory(http_session, endpoint)) == 260
+    # The empty page past the last device ends the walk
+    assert tenant.statuses == [200, 200, 200]
+    # Only the fields needed to resolve a device are cached
+    query = http_session.fake.calls()[0][2]
+    assert query["resolve"] == "[targets/devices.{uid,name,ipv4,serial,deviceType}]" and query["limit"] == "200"
+    assert len(cached_inventory(cdo_session(tenant, cache_ttl=300), endpoint)) == 260
+    assert tenant.statuses == [200, 200, 200]
+
+
+def test_stale_inventory_is_revalidated_page_by_page(cdo_session, endpoint):
+    tenant = Tenant(260)
+    cached_inventory(cdo_session(tenant, cache_ttl=300), endpoint)
+    tenant.devices[255]["name"] = "renamed"
+    tenant.statuses.clear()
+    devices = cached_inventory(cdo_session(tenant, cache_ttl=300, cache_refresh=True), endpoint)
+    # Only the second page changed and was downloaded again
+    assert tenant.statuses == [304, 200, 200]
+    assert [device["name"] for device in devices][254:256] == ["asa254", "renamed"]
+
+
+def test_deleted_device_is_no_longer_found(cdo_session, endpoint):
+    tenant = Tenant(3)
+    http_session = cdo_session(tenant, cache_ttl=300)
+    assert len(find_devices({"filter": "asa1"}, http_session, endpoint)) == 1
+    delete_device({"device_name": "asa1", "device_type": "asa"}, http_session, endpoint)
+    assert find_devices({"filter": "asa1"}, http_session, endpoint) == []
+    # The next task of the run does not see the deleted device either, and is still served from the cache
+    http_session = cdo_session(tenant, cache_ttl=300)
+    assert find_devices({"filter": "asa1"}, http_session, endpoint) == []
+    assert len(find_devices({"filter": "asa2"}, http_session, endpoint)) == 1
+    assert http_session.fake.calls() == []
+
+
+class AccessPolicies:
+    """The access policies of a cdFMC domain. Pages hold at most page_size policies whatever limit was asked for, and
+    link to the next page like the FMC does."""
+
+    path = CDOAPI.FMC_ACCESS_POLICY.value.replace("{domain_uid}", "domain")
+
+    def __init__(self, count: int, page_size: int = 10):
+        self.policies = [{"id": f"id{index}", "name": f"policy{index}"} for index in range(count)]
+        self.page_size = page_size
+
+    def __call__(self, method, path, query, body, headers):
+        assert method == "GET" and path == self.path and headers["fmc-hostname"] == "cdfmc"
+        if "name" in query:
+            items = [policy for policy in self.policies if policy["name"] == query["name"]]
+            return {"items": items, "paging": {"count": len(items)}}
+        offset, limit = int(query["offset"]), min(int(query["limit"]), self.page_size)
+        paging = {"count": len(self.policies), "offset": offset, "limit": limit}
+        if offset + limit < len(self.policies):
+            paging["next"] = [f"https://cdfmc/api/fmc_config/v1/{self.path}?offset={offset + limit}&limit={limit}"]
+        return {"items": self.policies[offset : offset + limit], "paging": paging}
+
+
+def test_access_policy_is_resolved_by_name_query_without_lookup_cache(cdo_session, endpoint):
+    http_session = cdo_session(AccessPolicies(35))
+    assert get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "policy33")["id"] == "id33"
+    assert [call[2] for call in http_session.fake.calls()] == [{"name": "policy33"}]
+    with pytest.raises(ObjectNotFound):
+        get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "missing")
+
+
+def test_access_policy_index_follows_the_paging_links(cdo_session, endpoint):
+    policies = AccessPolicies(35)
+    http_session = cdo_session(policies, lookup_cache_ttl=300)
+    for name in ("policy0", "policy34", "policy12"):
+        assert get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", name)["name"] == name
+    # Every policy was read once, page by page at the size the FMC chose
+    assert [call[2]["offset"] for call in http_session.fake.calls()] == ["0", "10", "20", "30"]
+    # The next task of the run is served from the lookup cache
+    http_session = cdo_session(policies, lookup_cache_ttl=300)
+    assert get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "policy20")["id"] == "id20"
+    assert http_session.fake.calls() == []
+
+
+def test_access_policy_index_is_refreshed_once_on_a_miss(cdo_session, endpoint):
+    policies = AccessPolicies(5)
+    http_session = cdo_session(policies, lookup_cache_ttl=300)
+    get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "policy0")
+    policies.policies.append({"id": "new", "name": "created-later"})
+    assert get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "created-later")["id"] == "new"
+    with pytest.raises(ObjectNotFound):
+        get_cdfmc_access_policy(http_session, endpoint, "cdfmc", "domain", "missing")
+    assert len(http_session.fake.calls()) == 3
+
+
+def test_short_pages_do_not_end_the_walk(cdo_session, endpoint):
+    http_session = cdo_session(Collection(200, max_page_size=50))
+    assert walked(http_session, endpoint, page_size=100) == [f"uid{index}" for index in range(200)]
+    # Each page starts after the items actually received, the empty page ends the walk
+    assert [call[2]["offset"] for call in http_session.fake.calls()] == ["0", "50", "100", "150", "200"]
+    http_session = cdo_session(Collection(200, max_page_size=50))
+    assert len(list(iter_items(http_session, endpoint, "items", page_size=100))) == 200
+
+
+def test_walk_stops_at_max_items(cdo_session, endpoint):
+    http_session = cdo_session(Collection(200, max_page_size=50))
+    assert walked(http_session, endpoint, page_size=100, max_items=120) == [f"uid{index}" for index in range(120)]
+    assert [call[2]["limit"] for call in http_session.fake.calls()] == ["100", "70", "20"]
+    http_session = cdo_session(Collection(200))
+    assert len(list(iter_items(http_session, endpoint, "items", page_size=30, max_items=45))) == 45
+
+
+def test_sequential_walk_reads_past_a_stale_count(cdo_session, endpoint):
+    http_session = cdo_session(Collection(130))
+    assert len(walked(http_session, endpoint, page_size=50, count=100)) == 130
+
+
+def test_planned_pages_are_yielded_in_order(cdo_session, endpoint):
+    http_session = cdo_session(Collection(230))
+    assert walked(http_session, endpoint, page_size=50, count=230, workers=4) == [f"uid{i}" for i in range(230)]
+    # Five planned pages, then the empty page past the count
+    assert sorted(int(call[2]["offset"]) for call in http_session.fake.calls()) == [0, 50, 100, 150, 200, 230]
+
+
+def test_short_planned_page_is_followed_by_the_rest_of_its_range(cdo_session, endpoint):
+    http_session = cdo_session(Collection(200, short={50: 20}))
+    assert walked(http_session, endpoint, page_size=50, count=200, workers=4) == [f"uid{i}" for i in range(200)]
+    # The gap after the short page is read sequentially, the plan is kept for the pages after it
+    assert [call[2]["limit"] for call in http_session.fake.calls() if call[2]["offset"] == "70"] == ["30"]
+    http_session = cdo_session(Collection(200, max_page_size=30))
+    assert walked(http_session, endpoint, page_size=100, count=200, workers=4) == [f"uid{i}" for i in range(200)]
+
+
+def test_planned_walk_reads_past_a_grown_collection(cdo_session, endpoint):
+    http_session = cdo_session(Collection(130))
+    assert walked(http_session, endpoint, page_size=50, count=100, workers=4) == [f"uid{i}" for i in range(130)]
+    assert walked(cdo_session(Collection(130)), endpoint, page_size=50, count=100, workers=4, max_items=110) == [
+        f"uid{i}" for i in range(110)
+    ]
+
+
+def test_planned_walk_stops_when_the_collection_shrank(cdo_session, endpoint):
+    http_session = cdo_session(Collection(60))
+    assert len(walked(http_session, endpoint, page_size=50, count=100, workers=4)) == 60
+    # The short last page is followed by an empty one, nothing is read past the planned range
+    assert [call[2]["offset"] for call in http_session.fake.calls()][-1] == "60"
+    assert len(http_session.fake.calls()) == 3
+
+
+class ModifiedTenant:
+    """Devices with a modification timestamp, filtered by the lastUpdatedDate range of the inventory query and reduced
+    to their uid by a uid-only resolve"""
+
+    def __init__(self, count: int):
+        self.devices = [
+            {"uid": f"uid{index}", "name": f"asa{index}", "lastUpdatedDate": 90 + index} for index in range(count)
+        ]
+        self.now = 100
+        self.queries = list()
+
+    def touch(self, device: dict):
+        self.now += 1
+        device["lastUpdatedDate"] = self.now
+
+    def __call__(self, method, path, query, body, headers):
+        self.queries.append(query)
+        devices = self.devices
+        since = re.search(r"lastUpdatedDate:\[(\d+) TO \*\]", query["q"])
+        if since:
+            devices = [device for device in devices if device["lastUpdatedDate"] >= int(since.group(1))]
+        if query["resolve"] == "[targets/devices.{uid}]":
+            devices = [{"uid": device["uid"]} for device in devices]
+        offset, limit = int(query["offset"]), int(query["limit"])
+        return devices[offset : offset + limit]
+
+
+def test_incremental_inventory_merges_changes_and_drops_deleted_devices(cdo_session, endpoint):
+    tenant = ModifiedTenant(5)
+    gather = {"device_type": "all", "incremental": True}
+    assert len(incremental_inventory(gather, cdo_session(tenant), endpoint)) == 5
+    tenant.devices[1]["name"] = "renamed"
+    tenant.touch(tenant.devices[1])
+    del tenant.devices[3]
+    tenant.devices.append({"uid": "uid9", "name": "asa9"})
+    tenant.touch(tenant.devices[-1])
+    tenant.queries.clear()
+    devices = {device["uid"]: device for device in incremental_inventory(gather, cdo_session(tenant), endpoint)}
+    assert sorted(devices) == ["uid0", "uid1", "uid2", "uid4", "uid9"]
+    assert devices["uid1"]["name"] == "renamed" and devices["uid0"]["name"] == "asa0"
+    # Only the devices modified since the high-water mark of the last run were downloaded in full, in one page
+    # followed by the empty page ending the walk
+    assert [query["q"] for query in tenant.queries if query["resolve"] != "[targets/devices.{uid}]"] == [
+        "((model:false)) AND (lastUpdatedDate:[94 TO *])"
+    ] * 2
+
+
+def test_incremental_inventory_ignores_max_items(cdo_session, endpoint):
+    gather = {"device_type": "all", "incremental": True, "max_items": 2}
+    assert len(incremental_inventory(gather, cdo_session(ModifiedTenant(5)), endpoint)) == 5
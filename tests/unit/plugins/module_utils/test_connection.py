@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import base64
+import json
+import pytest
+import requests
+from ansible.module_utils.connection import ConnectionError
+from ansible_collections.cisco.cdo.plugins.module_utils import connection
+from ansible_collections.cisco.cdo.plugins.module_utils.api_requests import CDORequests
+from ansible_collections.cisco.cdo.plugins.module_utils.connection import connection_host
+
+
+class FakeConnection:
+    """The JSON-RPC side of the cisco.cdo httpapi connection: records the requests sent over the socket and answers
+    them with reply, or raises it when it is an exception"""
+
+    options = {"network_os": "cisco.cdo.cdo", "host": "cdo.example.com"}
+    reply = None
+    sent = list()
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    def get_option(self, name: str):
+        if name not in self.options:
+            raise ConnectionError(f"unknown option {name}")
+        return self.options[name]
+
+    def tenant_key(self) -> str:
+        return "connection-tenant"
+
+    def send_request(self, method, url, body, headers, **kwargs):
+        FakeConnection.sent.append({"method": method, "url": url, "body": body, "headers": headers} | kwargs)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+@pytest.fixture
+def daemon(monkeypatch):
+    monkeypatch.setattr(connection, "Connection", FakeConnection)
+    monkeypatch.setattr(FakeConnection, "sent", list())
+    monkeypatch.setattr(FakeConnection, "reply", None)
+    return FakeConnection
+
+
+def reply(status: int, body: bytes, headers: dict = None) -> dict:
+    return {
+        "status": status,
+        "reason": "OK",
+        "headers": {"Content-Type": "application/json"} | (headers or {}),
+        "body": base64.b64encode(body).decode(),
+        "elapsed": 0.25,
+    }
+
+
+def test_requests_are_sent_over_the_socket_without_the_api_key(daemon, endpoint):
+    daemon.reply = reply(200, json.dumps({"uid": "1"}).encode(), {"Content-Encoding": "gzip"})
+    http_session = CDORequests.create_session(None, "test", endpoint, {}, "/socket")
+    http_session.headers["Authorization"] = "Bearer leaked"
+    result = CDORequests.post(http_session, f"https://{endpoint}", path="devices", data={"name": "asa"})
+    sent = daemon.sent[0]
+    assert "Authorization" not in sent["headers"] and sent["headers"]["User-Agent"] == "AnsibleCDOModule/test"
+    # The body makes the round trip through base64 unchanged, and so does the reply
+    assert json.loads(base64.b64decode(sent["body"])) == {"name": "asa"}
+    assert result == {"uid": "1"}
+    assert sent["allow_redirects"] is True and sent["timeout"] is None
+
+
+def test_request_options_are_forwarded(daemon, endpoint):
+    daemon.reply = reply(200, b"[]")
+    http_session = CDORequests.create_session(None, "test", endpoint, {}, "/socket")
+    response = http_session.get(f"https://{endpoint}/devices", timeout=(3, 30), verify=False, allow_redirects=False)
+    assert response.json() == [] and response.elapsed.total_seconds() == 0.25
+    assert {key: daemon.sent[0][key] for key in ("timeout", "verify", "allow_redirects")} == {
+        "timeout": (3, 30),
+        "verify": False,
+        "allow_redirects": False,
+    }
+
+
+def test_daemon_failure_is_a_connection_error(daemon, endpoint):
+    daemon.reply = ConnectionError("socket closed")
+    http_session = CDORequests.create_session(None, "test", endpoint, {}, "/socket")
+    with pytest.raises(requests.ConnectionError):
+        http_session.get(f"https://{endpoint}/devices")
+
+
+def test_tenant_is_the_one_of_the_connection(daemon, endpoint):
+    http_session = CDORequests.create_session(None, "test", endpoint, {}, "/socket")
+    assert http_session.tenant_key == "connection-tenant"
+    assert http_session.serial
+    with pytest.raises(ValueError):
+        CDORequests.create_session("task-api-key", "test", endpoint, {}, "/socket")
+
+
+def test_connection_host_is_only_given_for_cdo_connections(daemon, monkeypatch):
+    assert connection_host("/socket") == "cdo.example.com"
+    assert connection_host(None) is None
+    monkeypatch.setattr(FakeConnection, "options", {"network_os": "cisco.ios.ios", "host": "router"})
+    assert connection_host("/socket") is None
+    monkeypatch.setattr(FakeConnection, "options", {})
+    assert connection_host("/socket") is None
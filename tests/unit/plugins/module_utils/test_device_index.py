@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils.device_index import DeviceIndex, LARIndex
+
+DEVICES = [
+    {"uid": "1", "name": "austin", "ipv4": "10.0.0.1:443", "serial": "JAD1", "deviceType": "ASA"},
+    {"uid": "2", "name": "austin-csr", "ipv4": "10.0.0.2:22", "serial": "JAD2", "deviceType": "IOS"},
+    {"uid": "3", "name": "amarillo", "ipv4": "10.0.0.3:443", "deviceType": "ASA"},
+    {"uid": "4", "name": "elpaso", "ipv4": "10.0.0.4", "serial": "JAD4", "deviceType": "FTDC"},
+    # Named after the address of another device
+    {"uid": "5", "name": "10.0.0.1", "deviceType": "ASA"},
+]
+
+
+@pytest.fixture
+def index():
+    return DeviceIndex(DEVICES)
+
+
+@pytest.mark.parametrize(
+    "filter, uids",
+    [
+        ("austin", ["1"]),
+        ("10.0.0.2:22", ["2"]),
+        ("10.0.0.2", ["2"]),
+        ("JAD4", ["4"]),
+        ("10.0.0.1", ["5", "1"]),
+        ("austin*", ["1", "2"]),
+        ("a*", ["3", "1", "2"]),
+        ("*", ["5", "3", "1", "2", "4"]),
+        ("nothing", []),
+        ("nothing*", []),
+        (None, []),
+        ("", []),
+    ],
+)
+def test_lookup_by_name_ipv4_serial_and_prefix(index, filter, uids):
+    assert [device["uid"] for device in index.lookup(filter)] == uids
+
+
+@pytest.mark.parametrize("device_type, uids", [("asa", ["1"]), ("ios", ["2"]), ("ftd", []), ("all", ["1", "2"])])
+def test_lookup_by_device_type(index, device_type, uids):
+    assert [device["uid"] for device in index.lookup("austin*", device_type)] == uids
+
+
+def test_get_by_uid(index):
+    assert index.get("3")["name"] == "amarillo"
+    assert index.get("missing") is None
+
+
+def test_lar_index():
+    lars = [
+        {"uid": "a", "name": "SDC-1", "ipv4": "172.16.0.1:443"},
+        {"uid": "b", "name": "SDC-2"},
+        {"uid": "c", "name": "CDG", "ipv4": "172.16.0.1"},
+    ]
+    index = LARIndex(lars)
+    assert [lar["uid"] for lar in index.lookup("SDC-2")] == ["b"]
+    assert [lar["uid"] for lar in index.lookup("172.16.0.1")] == ["a", "c"]
+    assert [lar["uid"] for lar in index.lookup("172.16.0.1:443")] == ["a"]
+    assert index.lookup("SDC-3") == []
+    assert index.lookup() == lars
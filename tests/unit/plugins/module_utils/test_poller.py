@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import re
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils import poller
+from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
+from ansible_collections.cisco.cdo.plugins.module_utils.errors import APIError
+from ansible_collections.cisco.cdo.plugins.module_utils.poller import CDOPoller
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the poller, recording every pause"""
+    now, pauses = [1000.0], list()
+
+    def sleep(seconds):
+        pauses.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(poller, "time", lambda: now[0])
+    monkeypatch.setattr(poller, "sleep", sleep)
+    return pauses
+
+
+def jobs(states: dict):
+    """Answer job status queries from a script of successive states per job uid. The last state sticks."""
+
+    def status(uid: str) -> dict:
+        return {"uid": uid, "state": states[uid].pop(0) if len(states[uid]) > 1 else states[uid][0]}
+
+    def handler(method, path, query, body, headers):
+        if path == CDOAPI.JOBS.value:
+            return [status(uid) for uid in re.findall(r"uid:([\w-]+)", query["q"])]
+        return status(path.rsplit("/", 1)[1])
+
+    return handler
+
+
+def done(job: dict):
+    if job["state"] == "FAILED":
+        raise APIError(f"Job {job['uid']} failed")
+    return job if job["state"] == "DONE" else None
+
+
+def test_polls_every_object_with_one_query_per_tick(cdo_session, endpoint, clock):
+    http_session = cdo_session(jobs({"a": ["RUNNING", "DONE"], "b": ["RUNNING", "RUNNING", "DONE"], "c": ["DONE"]}))
+    polling = CDOPoller(http_session, endpoint, delay=1)
+    for uid in "abc":
+        polling.add(CDOAPI.JOBS.value, uid, done, timeout=60)
+    results = polling.run()
+    assert {key[1]: result["state"] for key, result in results.items()} == {"a": "DONE", "b": "DONE", "c": "DONE"}
+    # Three ticks: a, b and c pending, then a and b, then b alone
+    assert len(http_session.fake.calls("GET", CDOAPI.JOBS.value)) == 2
+    assert len(http_session.fake.calls("GET", f"{CDOAPI.JOBS.value}/b")) == 1
+
+
+def test_backs_off_to_twice_the_delay(cdo_session, endpoint, clock):
+    http_session = cdo_session(jobs({"a": ["RUNNING"] * 8 + ["DONE"]}))
+    CDOPoller(http_session, endpoint, delay=1, backoff=2).wait(CDOAPI.JOBS.value, "a", done, timeout=60)
+    assert clock == [0.5, 1, 2, 2, 2, 2, 2, 2]
+
+
+def test_times_out_with_the_last_status_seen(cdo_session, endpoint, clock):
+    http_session = cdo_session(jobs({"a": ["RUNNING"], "b": ["DONE"]}))
+    polling = CDOPoller(http_session, endpoint, delay=1)
+    polling.add(CDOAPI.JOBS.value, "a", done, timeout=5, on_timeout=lambda job: APIError(f"{job['state']} too long"))
+    polling.add(CDOAPI.JOBS.value, "b", done, timeout=5)
+    results = polling.run()
+    assert str(results[(CDOAPI.JOBS.value, "a")]) == "RUNNING too long"
+    assert results[(CDOAPI.JOBS.value, "b")]["state"] == "DONE"
+    # The last pause is cut short to end at the deadline
+    assert sum(clock) == 5
+
+
+def test_failed_check_fails_only_its_object(cdo_session, endpoint, clock):
+    http_session = cdo_session(jobs({"a": ["FAILED"], "b": ["RUNNING", "DONE"]}))
+    polling = CDOPoller(http_session, endpoint, delay=1)
+    for uid in "ab":
+        polling.add(CDOAPI.JOBS.value, uid, done, timeout=60)
+    results = polling.run()
+    assert isinstance(results[(CDOAPI.JOBS.value, "a")], APIError)
+    assert results[(CDOAPI.JOBS.value, "b")]["state"] == "DONE"
+    with pytest.raises(APIError):
+        CDOPoller(cdo_session(jobs({"a": ["FAILED"]})), endpoint).wait(CDOAPI.JOBS.value, "a", done, timeout=60)
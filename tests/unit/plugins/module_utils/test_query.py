@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils.query import CDOQuery, INVENTORY_FIELDS
+
+
+@pytest.mark.parametrize(
+    "module_params, q",
+    [
+        ({"device_type": "all"}, "((model:false))"),
+        ({"device_type": "asa"}, "((model:false) AND (deviceType:ASA)) AND (NOT deviceType:FMCE)"),
+        (
+            {"device_type": "ftd"},
+            "((model:false) AND ((deviceType:FMC_MANAGED_DEVICE) OR (deviceType:FTDC))) AND (NOT deviceType:FMCE)",
+        ),
+        (
+            {"device_type": "ios", "filter": "csr"},
+            "((model:false) AND ((name:csr) OR (ipv4:csr) OR (serial:csr)) AND (deviceType:IOS)) AND "
+            "(NOT deviceType:FMCE)",
+        ),
+        ({"modified_since": 1700000000000}, "((model:false)) AND (lastUpdatedDate:[1700000000000 TO *])"),
+    ],
+)
+def test_inventory_query(module_params, q):
+    assert CDOQuery.get_inventory_query(module_params)["q"] == q
+
+
+def test_inventory_fields():
+    assert CDOQuery.inventory_fields() == INVENTORY_FIELDS["full"]
+    assert CDOQuery.inventory_fields(["minimal", "serial", "name"]) == INVENTORY_FIELDS["minimal"] + ["serial"]
+    assert CDOQuery.get_inventory_query({"fields": ["uid", "name"]})["r"] == "[targets/devices.{uid,name}]"
+
+
+def test_lar_query():
+    assert CDOQuery.get_lar_query({"sdc": "SDC-1"}) == "name:SDC-1 OR ipv4:SDC-1"
+    assert CDOQuery.get_lar_query({}) is None
+
+
+def test_pending_changes_query():
+    base = (
+        "device.configState:NOT_SYNCED AND device.model:false"
+        " AND NOT device.deviceType:FTDC AND NOT device.deviceType:FMC_MANAGED_DEVICE"
+    )
+    assert CDOQuery.pending_changes_query({"device_type": "all"}, agg=True)["q"] == base
+    assert CDOQuery.pending_changes_query({"device_type": "asa", "device_name": "austin"})["q"] == (
+        f"device.name:austin AND {base} AND (device.deviceType:ASA)"
+    )
+    assert CDOQuery.pending_changes_query({"device_names": ["a", "b"], "tags": ["dc1"]})["q"] == (
+        f'(device.name:a OR device.name:b) AND {base} AND (device.tags.labels:"dc1")'
+    )
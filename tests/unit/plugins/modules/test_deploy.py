@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# Apache License v2.0+ (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import re
+import pytest
+from ansible_collections.cisco.cdo.plugins.module_utils import poller
+from ansible_collections.cisco.cdo.plugins.module_utils.api_endpoints import CDOAPI
+from ansible_collections.cisco.cdo.plugins.modules.deploy import bulk_deploy_changes, get_pending_deploy
+
+
+class Changelog:
+    """CDO side of a bulk deploy: the staged changes of count devices and the deploy jobs submitted for them. The
+    devices listed in stuck never finish deploying and the submissions numbered in rejected fail."""
+
+    def __init__(self, count: int, stuck: tuple = (), rejected: tuple = ()):
+        self.entries = [
+            {
+                "changeLogInstance": {
+                    "name": f"asa{index}",
+                    "objectReference": {"uid": f"uid{index}"},
+                    "events": [{"details": {"_class": "x"}, "user": "admin", "eventDate": 0, "action": "EDIT"}],
+                }
+            }
+            for index in range(count)
+        ]
+        self.stuck = stuck
+        self.rejected = rejected
+        self.submissions = 0
+        self.jobs = dict()
+
+    def job(self, uid: str) -> dict:
+        job = self.jobs[uid]
+        progress = dict()
+        for ref in job["objRefs"]:
+            progress[ref["uid"]] = {"progressStatus": "IN_PROGRESS" if ref["uid"] in self.stuck else "DONE"}
+        return job | {"stateMachinesProgress": progress}
+
+    def __call__(self, method, path, query, body, headers):
+        if method == "GET" and path == CDOAPI.DEPLOY.value:
+            offset, limit = int(query["offset"]), int(query["limit"])
+            return self.entries[offset : offset + limit]
+        if method == "POST" and path == CDOAPI.JOBS.value:
+            self.submissions += 1
+            if self.submissions - 1 in self.rejected:
+                return 500, {}
+            uid = f"job{len(self.jobs)}"
+            self.jobs[uid] = body | {"uid": uid}
+            return self.jobs[uid]
+        if method == "GET" and path == CDOAPI.JOBS.value:
+            return [self.job(uid) for uid in re.findall(r"uid:([\w-]+)", query["q"])]
+        if method == "GET" and path.startswith(f"{CDOAPI.JOBS.value}/"):
+            return self.job(path.rsplit("/", 1)[1])
+        return 404, {}
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(poller, "time", lambda: now[0])
+    monkeypatch.setattr(poller, "sleep", lambda seconds: now.__setitem__(0, now[0] + seconds))
+
+
+def bulk_deploy(**params) -> dict:
+    defaults = {"device_type": "all", "device_names": None, "tags": None, "batch_size": 50}
+    return defaults | {"timeout": 20, "interval": 2} | params
+
+
+@pytest.mark.parametrize("count, batch_size, jobs", [(120, 50, [50, 50, 20]), (3, 1, [1, 1, 1]), (10, 50, [10])])
+def test_devices_are_split_into_jobs_of_batch_size(cdo_session, endpoint, count, batch_size, jobs):
+    changelog = Changelog(count)
+    deployed = bulk_deploy_changes(bulk_deploy(batch_size=batch_size), cdo_session(changelog), endpoint)
+    assert [len(job["objRefs"]) for job in changelog.jobs.values()] == jobs
+    # Every device is deployed by exactly one job
+    refs = [ref["uid"] for job in changelog.jobs.values() for ref in job["objRefs"]]
+    assert sorted(refs) == sorted(f"uid{index}" for index in range(count))
+    assert len(deployed["deploy_jobs"]) == len(jobs)
+    assert deployed["timed_out"] == [] and deployed["not_submitted"] == []
+
+
+def test_nothing_to_deploy(cdo_session, endpoint):
+    changelog = Changelog(0)
+    assert bulk_deploy_changes(bulk_deploy(), cdo_session(changelog), endpoint) is None
+    assert changelog.jobs == {}
+
+
+def test_timed_out_jobs_are_reported_per_device(cdo_session, endpoint):
+    changelog = Changelog(5, stuck=("uid3",))
+    deployed = bulk_deploy_changes(bulk_deploy(batch_size=2), cdo_session(changelog), endpoint)
+    assert [job["uid"] for job in deployed["deploy_jobs"]] == ["job0", "job2"]
+    assert deployed["timed_out"] == [
+        {"device": "asa3", "job_uid": "job1", "device_uid": "uid3", "status": "IN_PROGRESS"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "limit, page_size, offset, requested, returned",
+    [(50, 20, 0, [20, 20, 10], 50), (50, 50, 100, [50, 30], 20), (None, 50, 0, [50, 50, 50, 50], 120)],
+)
+def test_pending_returns_up_to_limit_devices(cdo_session, endpoint, limit, page_size, offset, requested, returned):
+    http_session = cdo_session(Changelog(120))
+    pending = {"device_type": "all", "limit": limit, "offset": offset, "page_size": page_size, "summary": True}
+    assert len(get_pending_deploy(pending, http_session, endpoint)) == returned
+    assert [int(call[2]["limit"]) for call in http_session.fake.calls("GET", CDOAPI.DEPLOY.value)] == requested
+
+
+def test_rejected_job_does_not_stop_the_others(cdo_session, endpoint):
+    changelog = Changelog(5, rejected=(1,))
+    deployed = bulk_deploy_changes(bulk_deploy(batch_size=2), cdo_session(changelog), endpoint)
+    # The jobs before and after the rejected one are deployed
+    assert [job["uid"] for job in deployed["deploy_jobs"]] == ["job0", "job1"]
+    assert [ref["uid"] for job in deployed["deploy_jobs"] for ref in job["objRefs"]] == ["uid0", "uid1", "uid4"]
+    assert [(device["device"], device["device_uid"]) for device in deployed["not_submitted"]] == [
+        ("asa2", "uid2"),
+        ("asa3", "uid3"),
+    ]